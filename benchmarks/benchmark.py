@@ -0,0 +1,309 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmarks for watermark's cold and warm code paths.
+
+"cold" runs start from a fresh interpreter (or fresh in-process state)
+with an empty on-disk cache; "warm" runs repeat the call with all
+caches populated. The suite points `WATERMARK_CACHE_DIR` at a temporary
+directory, so it neither reads nor writes the user's cache.
+
+Usage:
+
+    python benchmarks/benchmark.py run [--save baseline.json]
+    python benchmarks/benchmark.py compare baseline.json [--threshold 1.25]
+
+`compare` re-runs the suite and exits with status 1 if any benchmark
+is slower than `threshold` times its baseline.
+
+License: BSD 3 clause
+"""
+
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import textwrap
+import time
+import types
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import watermark  # noqa: E402
+from watermark import distributions  # noqa: E402
+from watermark import gitinfo  # noqa: E402
+
+wm_module = sys.modules["watermark.watermark"]
+
+N_DISTRIBUTIONS = 60
+N_SNAPSHOT = 1000
+N_NAMESPACE = 100_000
+N_PACKED_REFS = 20_000
+
+
+def _median_time(func, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings)
+
+
+def _cold_start():
+    """Reset watermark's in-process caches and empty its on-disk cache."""
+    wm_module._static_facts = None
+    distributions._index = None
+    distributions._digests = None
+    shutil.rmtree(os.environ["WATERMARK_CACHE_DIR"], ignore_errors=True)
+
+
+def _subprocess_time(code, env, repeat):
+    """Median time reported by `code` run in fresh interpreters."""
+    script = textwrap.dedent(f"""
+        import sys, time
+        sys.path.insert(0, {ROOT!r})
+        start = time.perf_counter()
+        {code}
+        print(time.perf_counter() - start)
+    """)
+    timings = []
+    for _ in range(repeat):
+        out = subprocess.run([sys.executable, "-c", script], env=env,
+                             check=True, capture_output=True, text=True)
+        timings.append(float(out.stdout.split()[-1]))
+    return statistics.median(timings)
+
+
+def _process_time(args, env, repeat):
+    """Median wall time of running `python args...` to completion."""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run([sys.executable] + args, env=env, cwd=ROOT,
+                       check=True, stdout=subprocess.DEVNULL)
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings)
+
+
+def bench_import(tmp, repeat):
+    env = dict(os.environ, WATERMARK_CACHE_DIR=os.path.join(tmp, "import"))
+    return {
+        "import.cold": _subprocess_time("import watermark", env, 1),
+        "import.warm": _subprocess_time("import watermark", env, repeat),
+    }
+
+
+def bench_default(tmp, repeat):
+    env = dict(os.environ, WATERMARK_CACHE_DIR=os.path.join(tmp, "default"))
+    code = "import watermark; watermark.watermark()"
+    cold = _subprocess_time(code, env, 1)
+    return {
+        "default.cold": cold,
+        "default.warm_process": _subprocess_time(code, env, repeat),
+        "default.warm": _median_time(watermark.watermark, repeat),
+    }
+
+
+def bench_cli(tmp, repeat):
+    env = dict(os.environ, WATERMARK_CACHE_DIR=os.path.join(tmp, "cli"))
+    args = ["-m", "watermark"]
+    return {
+        "cli.cold": _process_time(args, env, 1),
+        "cli.warm": _process_time(args, env, repeat),
+        "cli.python": _process_time(["-c", "pass"], env, repeat),
+    }
+
+
+def bench_packages(tmp, repeat):
+    site = os.path.join(tmp, "site-packages")
+    os.makedirs(site)
+    names = []
+    for i in range(N_DISTRIBUTIONS):
+        name = f"bench-dist-{i}"
+        dist_info = os.path.join(site, f"bench_dist_{i}-1.{i}.dist-info")
+        os.makedirs(dist_info)
+        with open(os.path.join(dist_info, "METADATA"), "w") as f:
+            f.write(f"Metadata-Version: 2.1\nName: {name}\n"
+                    f"Version: 1.{i}\n\n")
+        names.append(name)
+    packages = ",".join(names)
+
+    sys.path.append(site)
+    try:
+        def cold():
+            _cold_start()
+            watermark.watermark(packages=packages)
+
+        return {
+            "packages.cold": _median_time(cold, repeat),
+            "packages.warm": _median_time(
+                lambda: watermark.watermark(packages=packages), repeat),
+        }
+    finally:
+        sys.path.remove(site)
+        distributions._index = None
+
+
+def bench_snapshot(tmp, repeat):
+    site = os.path.join(tmp, "snapshot-site-packages")
+    os.makedirs(site)
+    description = "Long description.\n" * 200
+    for i in range(N_SNAPSHOT):
+        dist_info = os.path.join(site, f"snap_dist_{i}-2.{i}.dist-info")
+        os.makedirs(dist_info)
+        with open(os.path.join(dist_info, "METADATA"), "w") as f:
+            f.write(f"Metadata-Version: 2.1\nName: snap-dist-{i}\n"
+                    f"Version: 2.{i}\nRequires-Dist: numpy\n\n"
+                    + description)
+
+    from watermark import snapshot
+
+    def scan():
+        with open(os.devnull, "w") as f:
+            snapshot.write_snapshot(f, paths=[site])
+
+    def importlib_metadata():
+        for dist in distributions._importlib_metadata().distributions(
+                path=[site]):
+            dist.metadata["Name"], dist.version
+
+    return {
+        "snapshot.scan": _median_time(scan, repeat),
+        "snapshot.importlib_metadata": _median_time(importlib_metadata,
+                                                    repeat),
+    }
+
+
+def _synthetic_namespace():
+    ns = {}
+    modules = [types.ModuleType(f"benchpkg{i}.sub") for i in range(100)]
+    for i in range(N_NAMESPACE):
+        kind = i % 4
+        if kind == 0:
+            ns[f"value_{i}"] = i
+        elif kind == 1:
+            func = types.FunctionType((lambda: None).__code__, {})
+            func.__module__ = f"benchpkg{i % 100}.sub"
+            ns[f"func_{i}"] = func
+        elif kind == 2:
+            ns[f"cls_{i}"] = type(f"C{i}", (), {
+                "__module__": f"benchpkg{i % 100}.sub"})
+        else:
+            ns[f"mod_{i}"] = modules[i % 100]
+    return ns
+
+
+def bench_iversions(tmp, repeat):
+    ns = _synthetic_namespace()
+    tracker = wm_module.ImportTracker()
+    wm_module._get_all_import_versions(ns, tracker=tracker)
+
+    def cold():
+        _cold_start()
+        wm_module._get_all_import_versions(ns)
+
+    return {
+        "iversions.cold": _median_time(cold, repeat),
+        "iversions.warm": _median_time(
+            lambda: wm_module._get_all_import_versions(ns, tracker=tracker),
+            repeat),
+    }
+
+
+def bench_git(tmp, repeat):
+    repo = os.path.join(tmp, "repo")
+    os.makedirs(repo)
+    env = dict(os.environ, GIT_AUTHOR_NAME="bench",
+               GIT_AUTHOR_EMAIL="bench@example.com",
+               GIT_COMMITTER_NAME="bench",
+               GIT_COMMITTER_EMAIL="bench@example.com")
+    for args in (["init", "-q"], ["commit", "-q", "--allow-empty", "-m", "x"],
+                 ["remote", "add", "origin", "https://example.com/x.git"]):
+        subprocess.run(["git"] + args, cwd=repo, env=env, check=True)
+    head = subprocess.run(["git", "rev-parse", "HEAD"], cwd=repo, check=True,
+                          capture_output=True, text=True).stdout.strip()
+    with open(os.path.join(repo, ".git", "packed-refs"), "a") as f:
+        for i in range(N_PACKED_REFS):
+            f.write(f"{head} refs/tags/bench-{i:06d}\n")
+    subprocess.run(["git", "pack-refs", "--all"], cwd=repo, check=True)
+
+    return {
+        "git.cold": _subprocess_time(
+            f"from watermark import gitinfo; "
+            f"gitinfo.read_git_info({repo!r}, dirty=True)",
+            dict(os.environ), 1),
+        "git.warm": _median_time(
+            lambda: gitinfo.read_git_info(repo, dirty=True), repeat),
+        "git.subprocess": _median_time(
+            lambda: gitinfo._read_git_subprocess(repo, True), repeat),
+    }
+
+
+BENCHMARKS = [bench_import, bench_default, bench_cli, bench_packages,
+              bench_snapshot, bench_iversions, bench_git]
+
+
+def run_suite(repeat):
+    results = {}
+    tmp = tempfile.mkdtemp(prefix="watermark-bench-")
+    saved_cache_dir = os.environ.get("WATERMARK_CACHE_DIR")
+    os.environ["WATERMARK_CACHE_DIR"] = os.path.join(tmp, "cache")
+    try:
+        for bench in BENCHMARKS:
+            if bench is bench_git and shutil.which("git") is None:
+                continue
+            results.update(bench(tmp, repeat))
+    finally:
+        if saved_cache_dir is None:
+            del os.environ["WATERMARK_CACHE_DIR"]
+        else:
+            os.environ["WATERMARK_CACHE_DIR"] = saved_cache_dir
+        shutil.rmtree(tmp, ignore_errors=True)
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    sub = parser.add_subparsers(dest="command", required=True)
+    run = sub.add_parser("run", help="run the benchmarks")
+    run.add_argument("--save", help="write the results to this JSON file")
+    compare = sub.add_parser("compare", help="compare against a baseline")
+    compare.add_argument("baseline", help="JSON file written by `run --save`")
+    compare.add_argument("--threshold", type=float, default=1.25,
+                         help="maximum allowed slowdown ratio")
+    for p in (run, compare):
+        p.add_argument("--repeat", type=int, default=5,
+                       help="repetitions per warm benchmark")
+    args = parser.parse_args(argv)
+
+    results = run_suite(args.repeat)
+    if args.command == "run":
+        for name, seconds in results.items():
+            print(f"{name:24s} {seconds * 1000:10.2f} ms")
+        if args.save:
+            with open(args.save, "w") as f:
+                json.dump(results, f, indent=2)
+        return 0
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    failed = False
+    for name, seconds in results.items():
+        if name not in baseline:
+            print(f"{name:24s} {seconds * 1000:10.2f} ms  (no baseline)")
+            continue
+        ratio = seconds / baseline[name] if baseline[name] else 1.0
+        status = "SLOWER" if ratio > args.threshold else "ok"
+        failed |= ratio > args.threshold
+        print(f"{name:24s} {seconds * 1000:10.2f} ms  "
+              f"{ratio:5.2f}x baseline  {status}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
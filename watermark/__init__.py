@@ -7,9 +7,26 @@
 
 from __future__ import absolute_import
 
-from .version import __version__
-
-from watermark.magic import *
+from watermark.watermark import awatermark
 from watermark.watermark import watermark
 
-__all__ = ["watermark", "magic"]
+__all__ = ["watermark", "awatermark", "survey", "magic"]
+
+# The IPython magic is only needed inside IPython/Jupyter, so it is
+# imported on first access (e.g., by `%load_ext watermark`) to keep a plain
+# `import watermark` free of the IPython import cost.
+_MAGIC_ATTRS = ("WaterMark", "load_ipython_extension", "PackageNotFoundError")
+
+
+def __getattr__(name):
+    if name == "magic" or name in _MAGIC_ATTRS:
+        import importlib
+        magic = importlib.import_module("watermark.magic")
+        return magic if name == "magic" else getattr(magic, name)
+    if name == "survey":
+        from .environments import survey
+        return survey
+    if name == "__version__":
+        from . import version
+        return version.__version__
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+"""
+Small on-disk JSON cache shared by the watermark collectors.
+
+Files live in `$WATERMARK_CACHE_DIR` or, by default, in
+`$XDG_CACHE_HOME/watermark` (`~/.cache/watermark`). Writes go to a
+temporary file that is atomically renamed into place, so concurrent
+readers never observe a partially written file. Setting
+`WATERMARK_NO_CACHE=1` disables the on-disk cache.
+
+License: BSD 3 clause
+"""
+
+import json
+import os
+
+
+def cache_dir():
+    """Return the directory used for watermark's cache files."""
+    path = os.environ.get("WATERMARK_CACHE_DIR")
+    if path:
+        return path
+    base = os.environ.get("XDG_CACHE_HOME") or \
+        os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(base, "watermark")
+
+
+def enabled():
+    return os.environ.get("WATERMARK_NO_CACHE", "") in ("", "0")
+
+
+def load_json(name):
+    """Return the cached object stored under `name` or None."""
+    if not enabled():
+        return None
+    try:
+        with open(os.path.join(cache_dir(), name), encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def dump_json(name, data):
+    """Atomically store `data` under `name`; errors are ignored since the
+    cache is only an optimization."""
+    if not enabled():
+        return
+    import tempfile
+
+    directory = cache_dir()
+    try:
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=f".{name}.")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(data, f)
+            os.replace(tmp_path, os.path.join(directory, name))
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+    except OSError:
+        pass
+
+
+# Bump when the layout of the cached facts changes.
+FACTS_VERSION = 1
+
+
+def facts_key():
+    """Return the key identifying static facts of this host/interpreter.
+
+    It combines the interpreter path and prefix with the boot ID and
+    kernel release (so reboots and kernel upgrades invalidate it) and
+    the mtimes of the site-packages directories (so installing packages
+    does as well).
+    """
+    import platform
+    import socket
+    import sys
+
+    try:
+        with open("/proc/sys/kernel/random/boot_id", encoding="ascii") as f:
+            boot_id = f.read().strip()
+    except OSError:
+        boot_id = None
+    site_dirs = []
+    for path in sys.path:
+        if os.path.basename(path) in ("site-packages", "dist-packages"):
+            try:
+                site_dirs.append([path, os.stat(path).st_mtime_ns])
+            except OSError:
+                pass
+    return {
+        "version": FACTS_VERSION,
+        "executable": sys.executable,
+        "prefix": sys.prefix,
+        "hostname": socket.gethostname(),
+        "boot_id": boot_id,
+        "release": platform.release(),
+        "site_dirs": site_dirs,
+    }
+
+
+def facts_file(key):
+    """Return the cache file name for `key`; one file per host and
+    interpreter, so unrelated interpreters never contend for it."""
+    import hashlib
+
+    ident = f"{key['hostname']}\0{key['executable']}\0{key['prefix']}"
+    digest = hashlib.sha1(ident.encode("utf-8")).hexdigest()[:16]
+    return f"facts-v{FACTS_VERSION}-{digest}.json"
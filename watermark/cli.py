@@ -0,0 +1,201 @@
+# -*- coding: utf-8 -*-
+"""
+Command line interface, available as `watermark` and `python -m watermark`.
+
+The arguments are shared with the `%watermark` magic so that both accept
+the same flags. This module must not import IPython: stamping the logs of
+short batch jobs should only cost the startup of a plain interpreter.
+
+License: BSD 3 clause
+"""
+
+import argparse
+import sys
+
+from watermark.watermark import watermark
+
+
+# (flags, keyword arguments) of `ArgumentParser.add_argument()`, in the
+# order in which they are listed by `%watermark?` and `watermark --help`.
+ARGUMENTS = [
+    (('-a', '--author'), dict(
+        type=str, help='prints author name')),
+    (('-gu', '--github_username'), dict(
+        type=str, help='prints author github username')),
+    (('-e', '--email'), dict(
+        type=str, help='prints author email')),
+    (('-ws', '--website'), dict(
+        type=str, help='prints author or project website')),
+    (('-d', '--date'), dict(
+        action='store_true', help='prints current date as YYYY-mm-dd')),
+    (('-n', '--datename'), dict(
+        action='store_true',
+        help='prints date with abbrv. day and month names')),
+    (('-t', '--time'), dict(
+        action='store_true', help='prints current time as HH-MM-SS')),
+    (('-i', '--iso8601'), dict(
+        action='store_true',
+        help='prints the combined date and time including the time zone'
+             ' in the ISO 8601 standard with UTC offset')),
+    (('-z', '--timezone'), dict(
+        action='store_true', help='appends the local time zone')),
+    (('-u', '--updated'), dict(
+        action='store_true', help='appends a string "Last updated: "')),
+    (('-c', '--custom_time'), dict(
+        type=str, help='prints a valid strftime() string')),
+    (('-v', '--python'), dict(
+        action='store_true', help='prints Python and IPython version')),
+    (('-p', '--packages'), dict(
+        type=str,
+        help='prints versions of specified Python modules and packages; '
+             'globs (torch*) and re: regular expressions match installed '
+             'packages')),
+    (('-co', '--conda'), dict(
+        action='store_true',
+        help='prints name of current conda environment, and the conda '
+             'build and channel of packages (-p, -iv)')),
+    (('-h', '--hostname'), dict(
+        action='store_true', help='prints the host name')),
+    (('-m', '--machine'), dict(
+        action='store_true', help='prints system and machine info')),
+    (('-g', '--githash'), dict(
+        action='store_true', help='prints current Git commit hash')),
+    (('-r', '--gitrepo'), dict(
+        action='store_true', help='prints current Git remote address')),
+    (('-b', '--gitbranch'), dict(
+        action='store_true', help='prints current Git branch')),
+    (('-gd', '--gitdirty'), dict(
+        action='store_true',
+        help='prints whether tracked files in the Git work tree '
+             'were modified')),
+    (('-w', '--watermark'), dict(
+        action='store_true',
+        help='prints the current version of watermark')),
+    (('-iv', '--iversions'), dict(
+        action='store_true',
+        help='prints the name/version of all imported modules')),
+    (('--gpu',), dict(
+        action='store_true',
+        help='prints GPU information (currently limited to NVIDIA GPUs),'
+             ' if available')),
+    (('-je', '--jupyter_env'), dict(
+        action='store_true',
+        help='prints the current Jupyter environment (e.g., Colab, VS Code)')),
+    (('--python_installation',), dict(
+        action='store_true',
+        help='include information about how Python was installed')),
+    (('--fingerprint',), dict(
+        action='store_true',
+        help='prints a short digest of the interpreter, the installed '
+             'distributions, the Git commit and the host')),
+    (('--resources',), dict(
+        action='store_true',
+        help='prints memory, threads, open files, cgroup limits, load '
+             'and CPU frequency of the process')),
+    (('--check_latest',), dict(
+        action='store_true',
+        help='check if the latest packages are installed')),
+    (('--index_url',), dict(
+        type=str, help='PyPI-compatible JSON API used by --check_latest')),
+    (('--import_fallback',), dict(
+        action='store_true',
+        help='import modules whose version cannot be determined '
+             'without importing them')),
+    (('--verify',), dict(
+        action='store_true',
+        help='check the files of packages (-p, -iv) against the hashes '
+             'in their RECORD')),
+    (('--output_format',), dict(
+        type=str, default='text', choices=['text', 'json'],
+        help='prints the sections as formatted text or as JSON')),
+    (('--profile',), dict(
+        action='store_true',
+        help='appends the time spent on each section, including '
+             'subprocesses and network connections')),
+    (('--timeout',), dict(
+        type=float,
+        help='time budget in seconds for the Git, GPU, package '
+             'and system sections')),
+    (('--diff',), dict(
+        type=str, metavar='BASELINE',
+        help='prints only what changed since BASELINE, a watermark saved '
+             'with --output_format json')),
+    (('--watch',), dict(
+        action='store_true',
+        help='prints the watermark and, after each cell, the sections that '
+             'changed (new imports, installed packages, Git commits)')),
+    (('--unwatch',), dict(
+        action='store_true', help='stops --watch')),
+]
+
+# Arguments that need an interactive session.
+MAGIC_ONLY = ('iversions', 'watch', 'unwatch')
+
+
+def to_watermark_kwargs(args):
+    """Map parsed arguments to the keyword arguments of `watermark()`."""
+    args = dict(args)
+    # renaming not to pollute the namespace
+    # while preserving backward compatibility
+    args['current_date'] = args.pop('date')
+    args['current_time'] = args.pop('time')
+    args['diff_against'] = args.pop('diff')
+    return args
+
+
+def build_parser():
+    # -h is taken by --hostname, as in the magic
+    parser = argparse.ArgumentParser(
+        prog='watermark', add_help=False,
+        description='Prints date/time stamps and various system '
+                    'information.')
+    for flags, kwargs in ARGUMENTS:
+        if flags[-1].lstrip('-') not in MAGIC_ONLY:
+            parser.add_argument(*flags, **kwargs)
+    parser.add_argument('--survey', nargs='+', metavar='TARGET',
+                        help='prints a table of the Python and package '
+                             'versions (-p) of these interpreters or '
+                             'environment prefixes')
+    parser.add_argument('--max_workers', type=int,
+                        help='number of interpreters surveyed at once')
+    parser.add_argument('--snapshot', nargs='?', const='-', metavar='FILE',
+                        help='writes all installed distributions to FILE '
+                             '(default: standard output) instead')
+    parser.add_argument('--snapshot_format', default='jsonl',
+                        choices=['jsonl', 'requirements'],
+                        help='JSON Lines or name==version lines')
+    parser.add_argument('--help', action='help',
+                        help='show this help message and exit')
+    return parser
+
+
+def main(argv=None):
+    args = vars(build_parser().parse_args(argv))
+    survey, max_workers = args.pop('survey'), args.pop('max_workers')
+    snapshot = args.pop('snapshot')
+    snapshot_format = args.pop('snapshot_format')
+    if snapshot:
+        from watermark.snapshot import write_snapshot
+
+        try:
+            write_snapshot(None if snapshot == '-' else snapshot,
+                           format=snapshot_format)
+        except BrokenPipeError:
+            # The reader (e.g., `head`) exited early; silence the error
+            # Python would report when flushing stdout at exit
+            import os
+            os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+            return 1
+        return 0
+    if survey:
+        from watermark.environments import survey as survey_environments
+
+        sys.stdout.write(survey_environments(
+            survey, packages=args['packages'], max_workers=max_workers,
+            timeout=args['timeout'],
+            output_format=args['output_format']) + "\n")
+        return 0
+    args['iversions'] = False
+
+    sys.stdout.write(watermark(**to_watermark_kwargs(args)) + "\n")
+    return 0
@@ -0,0 +1,179 @@
+# -*- coding: utf-8 -*-
+"""
+Aggregation of the watermarks of many worker processes or nodes.
+
+`aggregate()` first collects the watermark of the calling process as
+the reference and hands the digests of its sections to every worker.
+Workers reply with their ID and section digests, and include a
+section's content only where its digest differs from the reference, so
+agreeing workers only send a few short hashes. The replies are grouped
+by their digests; the report lists the sections of the largest group
+once and, for every other group, only the keys that differ from it.
+
+Workers are reached through a transport: a callable
+`transport(func, *args)` that runs `func(*args)` on every worker and
+returns the results. `ExecutorTransport` runs it on a
+`concurrent.futures` executor (by default a local process pool), so the
+same code path can be exercised on a single machine.
+
+License: BSD 3 clause
+"""
+
+import hashlib
+import json
+import os
+import socket
+
+from .watermark import _DIFF_SECTIONS
+from .watermark import _comparable_values
+from .watermark import _diff_lines
+from .watermark import _diff_sections
+from .watermark import _generate_formatted_text
+from .watermark import watermark
+
+
+class ExecutorTransport:
+    """Run the worker function `n_workers` times on `executor`, by
+    default a `ProcessPoolExecutor` with `n_workers` processes.
+
+    Any `concurrent.futures.Executor` works, including those of cluster
+    frameworks. Tasks that happen to run in the same process yield the
+    same worker ID and are counted once.
+    """
+
+    def __init__(self, n_workers=None, executor=None):
+        self.n_workers = n_workers or os.cpu_count() or 1
+        self.executor = executor
+
+    def __call__(self, func, *args):
+        if self.executor is not None:
+            return self._run(self.executor, func, args)
+        from concurrent.futures import ProcessPoolExecutor
+
+        with ProcessPoolExecutor(max_workers=self.n_workers) as executor:
+            return self._run(executor, func, args)
+
+    def _run(self, executor, func, args):
+        futures = [executor.submit(func, *args)
+                   for _ in range(self.n_workers)]
+        return [future.result() for future in futures]
+
+
+def worker_id():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def collect_worker(kwargs, reference_digests):
+    """Worker side of `aggregate()`: return this worker's ID and section
+    digests, and the sections whose digest differs from the reference."""
+    sections = _comparable_sections(
+        watermark(**dict(kwargs, output_format="dict")))
+    digests = {name: _digest(section) for name, section in sections.items()}
+    return {
+        "worker": worker_id(),
+        "digests": digests,
+        "sections": {name: sections[name] for name in sections
+                     if digests[name] != reference_digests.get(name)},
+    }
+
+
+# Sections that differ between nodes by design; the hostname is part of
+# the worker ID and the fingerprint includes it
+_NODE_SECTIONS = ("hostname", "fingerprint")
+
+
+def _comparable_sections(sections):
+    # Date/time, author and profile sections differ between any two
+    # workers and are left out as well; so is the GPU memory usage and
+    # utilization, leaving the static facts of each device
+    sections = _comparable_values(sections)
+    return {name: section for name, section in sections.items()
+            if (name in _DIFF_SECTIONS or name == "packages")
+            and name not in _NODE_SECTIONS}
+
+
+def _digest(section):
+    canonical = json.dumps(section, sort_keys=True).encode("utf-8")
+    return hashlib.sha256(canonical).hexdigest()[:16]
+
+
+def aggregate(transport=None, output_format="text", **kwargs):
+    """Collect and merge the watermarks of all workers.
+
+    Parameters
+    ----------
+    transport : callable (default: None)
+        `transport(func, *args)` runs `func(*args)` on each worker and
+        returns the list of results; defaults to `ExecutorTransport()`,
+        one process per CPU.
+
+    output_format : str (default: "text")
+        `"text"`, `"dict"` or `"json"`. The dict has the number of
+        `"workers"` and a list of `"groups"`, largest first; the first
+        group has the full `"sections"`, the others the `"differences"`
+        from the first group as added/removed/changed keys.
+
+    **kwargs :
+        Arguments of `watermark()` selecting the sections, e.g.,
+        `python=True, packages="numpy", gpu=True`.
+    """
+    if output_format not in ("text", "dict", "json"):
+        raise ValueError(
+            f"output_format must be 'text', 'dict' or 'json', "
+            f"not {output_format!r}")
+    if transport is None:
+        transport = ExecutorTransport()
+
+    reference = _comparable_sections(
+        watermark(**dict(kwargs, output_format="dict")))
+    reference_digests = {name: _digest(section)
+                         for name, section in reference.items()}
+    replies = {}
+    for reply in transport(collect_worker, kwargs, reference_digests):
+        replies.setdefault(reply["worker"], reply)
+
+    # Workers with the same digests have the same sections
+    groups = {}
+    for worker, reply in replies.items():
+        key = tuple(sorted(reply["digests"].items()))
+        groups.setdefault(key, []).append(reply)
+    groups = sorted(groups.values(), key=len, reverse=True)
+
+    report = {"workers": len(replies), "groups": []}
+    base = None
+    for replies_of_group in groups:
+        first = replies_of_group[0]
+        sections = {name: first["sections"].get(name, reference.get(name))
+                    for name in first["digests"]}
+        group = {"workers": sorted(reply["worker"]
+                                   for reply in replies_of_group)}
+        if base is None:
+            base = group["sections"] = sections
+        else:
+            group["differences"] = _diff_sections(base, sections)
+        report["groups"].append(group)
+
+    if output_format == "dict":
+        return report
+    if output_format == "json":
+        return json.dumps(report)
+    return format_report(report)
+
+
+def format_report(report):
+    """Format an `aggregate()` report as text."""
+    groups = report["groups"]
+    lines = [f"Workers: {report['workers']} in {len(groups)} "
+             f"group{'s' if len(groups) != 1 else ''}"]
+    for i, group in enumerate(groups, 1):
+        workers = group["workers"]
+        lines.append("")
+        lines.append(f"Group {i}: {len(workers)} "
+                     f"worker{'s' if len(workers) != 1 else ''} "
+                     f"({', '.join(workers)})")
+        if "sections" in group:
+            lines.append(_generate_formatted_text(
+                list(group["sections"].values())).rstrip("\n"))
+        else:
+            lines.extend(_diff_lines(group["differences"]))
+    return "\n".join(lines)
@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+"""
+Index of the packages installed in the active conda environment.
+
+The index is read from `$CONDA_PREFIX/conda-meta/*.json` instead of
+running `conda list`. Name, version and build are taken from the file
+names (`<name>-<version>-<build>.json`) and only the channel is read
+from the files themselves. The index is cached in memory and on disk
+and rebuilt when the mtime of `conda-meta` changes; files that were
+already indexed are not read again.
+
+License: BSD 3 clause
+"""
+
+import os
+import re
+import sys
+import threading
+
+from . import cache
+from .distributions import normalize_name
+
+
+_lock = threading.Lock()
+_index = None
+
+_CHANNEL_RE = re.compile(rb'"(s?channel)":\s*"([^"]*)"')
+# Platform subdirectories of a channel, e.g., linux-64 or noarch
+_SUBDIR_RE = re.compile(r"noarch|(linux|osx|win|freebsd|zos|emscripten"
+                        r"|wasi)-\w+")
+
+
+def conda_prefix():
+    """Return the prefix of the active conda environment or None."""
+    prefix = os.environ.get("CONDA_PREFIX") or sys.prefix
+    if os.path.isdir(os.path.join(prefix, "conda-meta")):
+        return prefix
+    return None
+
+
+def get_index():
+    """Return the `CondaIndex` of the active environment or None."""
+    global _index
+    prefix = conda_prefix()
+    if prefix is None:
+        return None
+    meta = os.path.join(prefix, "conda-meta")
+    try:
+        mtime = os.stat(meta).st_mtime_ns
+    except OSError:
+        return None
+    with _lock:
+        if _index is None or (_index.prefix, _index.mtime) != (prefix, mtime):
+            _index = CondaIndex(prefix, mtime, previous=_index)
+        return _index
+
+
+class CondaIndex:
+    """Packages of the conda environment at `prefix`, by normalized
+    name, as `{"name", "version", "build", "channel"}` dicts."""
+
+    def __init__(self, prefix, mtime, previous=None):
+        self.prefix = prefix
+        self.mtime = mtime
+        cache_file = _cache_file(prefix)
+        stored = cache.load_json(cache_file) or {}
+        if stored.get("mtime") == mtime:
+            self.files = stored["files"]
+            self.packages = stored["packages"]
+            return
+
+        # Channels of files indexed before, by file name
+        known = {}
+        for old in (stored.get("files"), getattr(previous, "files", None)):
+            known.update(old or {})
+        self.files = {}
+        self.packages = {}
+        meta = os.path.join(prefix, "conda-meta")
+        for filename in sorted(os.listdir(meta)):
+            if not filename.endswith(".json"):
+                continue
+            parts = filename[:-len(".json")].rsplit("-", 2)
+            if len(parts) != 3:
+                continue
+            channel = known.get(filename)
+            if channel is None:
+                channel = _read_channel(os.path.join(meta, filename))
+            self.files[filename] = channel
+            name, version, build = parts
+            self.packages[normalize_name(name)] = {
+                "name": name, "version": version, "build": build,
+                "channel": channel,
+            }
+        cache.dump_json(cache_file, {"mtime": mtime, "files": self.files,
+                                     "packages": self.packages})
+
+    def lookup(self, name, dist_index=None):
+        """Return the package `name`, which may also be a module name
+        that `dist_index` maps to a distribution, or None."""
+        package = self.packages.get(normalize_name(name))
+        if package is None and dist_index is not None:
+            found = dist_index.lookup(name)
+            if found is not None:
+                package = self.packages.get(normalize_name(found[0]))
+        return package
+
+
+def _cache_file(prefix):
+    import hashlib
+
+    digest = hashlib.sha1(prefix.encode("utf-8")).hexdigest()[:16]
+    return f"conda-{digest}.json"
+
+
+def _read_channel(path):
+    try:
+        with open(path, "rb") as f:
+            data = f.read()
+    except OSError:
+        return "unknown"
+    channels = dict(_CHANNEL_RE.findall(data))
+    # "schannel" is the short name (e.g., "conda-forge") in newer conda
+    channel = channels.get(b"schannel") or channels.get(b"channel")
+    return _channel_name(channel.decode()) if channel else "unknown"
+
+
+def _channel_name(channel):
+    """Shorten a channel URL the way `conda list` does, e.g.
+    `https://conda.anaconda.org/conda-forge/linux-64` -> `conda-forge`."""
+    if "://" not in channel:
+        return channel
+    parts = channel.split("://", 1)[1].rstrip("/").split("/")
+    host, path = parts[0], parts[1:]
+    if path and _SUBDIR_RE.fullmatch(path[-1]):
+        path = path[:-1]
+    if host in ("conda.anaconda.org", "repo.anaconda.com") and path:
+        return "/".join(path)
+    return "/".join([host] + path)
@@ -0,0 +1,391 @@
+# -*- coding: utf-8 -*-
+"""
+Index of the installed distributions, used to resolve package versions.
+
+The index is built in a single pass over `importlib.metadata`'s
+distributions and maps distribution names, their normalized (PEP 503)
+forms and top-level module names to versions. It is rebuilt whenever
+`sys.path` or the modification time of one of its directories changes,
+e.g. after a `pip install`.
+
+License: BSD 3 clause
+"""
+
+import functools
+import os
+import re
+import sys
+import threading
+
+
+_lock = threading.Lock()
+_index = None
+
+
+def _importlib_metadata():
+    try:
+        import importlib.metadata as importlib_metadata
+    except ImportError:
+        # Running on pre-3.8 Python; use importlib-metadata package
+        import importlib_metadata
+    return importlib_metadata
+
+
+def normalize_name(name):
+    """Normalize a distribution name as described in PEP 503."""
+    return re.sub(r"[-_.]+", "-", name).lower()
+
+
+def get_index():
+    """Return the `DistributionIndex` for the current `sys.path`."""
+    global _index
+    key = _paths_key(sys.path)
+    with _lock:
+        if _index is None or _index.key != key:
+            _index = DistributionIndex(sys.path, key)
+        return _index
+
+
+def _paths_key(paths):
+    key = []
+    for path in paths:
+        try:
+            key.append((path, os.stat(path or ".").st_mtime_ns))
+        except OSError:
+            key.append((path, None))
+    return tuple(key)
+
+
+class DistributionIndex:
+    """Name, normalized-name and top-level module lookup of installed
+    distributions on `paths`."""
+
+    def __init__(self, paths, key=None):
+        self.key = key
+        self.paths = list(paths)
+        # normalized name -> (name, version, distribution)
+        self.by_name = {}
+        # top-level module -> set of normalized distribution names
+        self.by_module = {}
+        self._unmapped = []
+        self._files_scanned = False
+        self._scan_lock = threading.Lock()
+
+        importlib_metadata = _importlib_metadata()
+        for dist in importlib_metadata.distributions(path=self.paths):
+            name, version = _read_name_version(dist)
+            if not name:
+                continue
+            normalized = normalize_name(name)
+            # The first distribution on the path wins, as in
+            # importlib.metadata.version()
+            if normalized in self.by_name:
+                continue
+            self.by_name[normalized] = (name, version, dist)
+            top_level = dist.read_text("top_level.txt")
+            if top_level is None:
+                self._unmapped.append(normalized)
+                continue
+            for module in top_level.split():
+                self._add_module(module.replace("/", "."), normalized)
+
+    def _add_module(self, module, normalized, by_module=None):
+        if by_module is None:
+            by_module = self.by_module
+        by_module.setdefault(module.split(".")[0], set()).add(normalized)
+
+    def _scan_files(self):
+        # Distributions without top_level.txt (e.g. built by backends
+        # other than setuptools) are mapped from their RECORD on the
+        # first lookup miss only. The index is shared between threads,
+        # so the map is filled in a copy that replaces `by_module` once
+        # it is complete.
+        with self._scan_lock:
+            if self._files_scanned:
+                return
+            by_module = {module: set(owners)
+                         for module, owners in self.by_module.items()}
+            for normalized in self._unmapped:
+                dist = self.by_name[normalized][2]
+                for path in dist.files or ():
+                    parts = path.parts
+                    if len(parts) > 1 and "." not in parts[0]:
+                        self._add_module(parts[0], normalized, by_module)
+                    elif len(parts) == 1 and path.suffix in (".py", ".so",
+                                                            ".pyd"):
+                        self._add_module(path.name.split(".")[0],
+                                         normalized, by_module)
+            self.by_module = by_module
+            self._files_scanned = True
+
+    def lookup(self, name):
+        """Return `(distribution name, version)` for a distribution or
+        top-level module `name`, or None if it is not installed."""
+        entry = self.by_name.get(normalize_name(name))
+        if entry is None:
+            module = name.split(".")[0]
+            if module not in self.by_module and not self._files_scanned:
+                self._scan_files()
+            owners = self.by_module.get(module, ())
+            # Namespace packages shared by several distributions are
+            # ambiguous
+            if len(owners) != 1:
+                return None
+            entry = self.by_name[next(iter(owners))]
+        return entry[0], entry[1]
+
+    def version(self, name):
+        """Return the installed version of `name` or None."""
+        found = self.lookup(name)
+        return found[1] if found else None
+
+
+# Package names starting with this prefix are regular expressions
+REGEX_PREFIX = "re:"
+
+
+def is_pattern(name):
+    """Return whether `name` is a glob (e.g., `torch*`) or an `re:`
+    regular expression rather than a package name."""
+    return name.startswith(REGEX_PREFIX) or any(c in name for c in "*?[")
+
+
+def match_names(patterns, names):
+    """Return `{pattern: [name, ...]}` of the `names` that match each of
+    `patterns`, sorted by normalized name.
+
+    Globs and regular expressions are matched case-insensitively against
+    normalized names (e.g., `acme-*` matches `Acme_Utils`). The patterns
+    are combined into one regular expression that every name is tested
+    against once, so the cost hardly grows with the number of patterns;
+    only the names it matches are tested against each pattern to find
+    all the patterns they match.
+    """
+    matcher, compiled = _compile_patterns(tuple(patterns))
+    matches = {pattern: [] for pattern in patterns}
+    seen = set()
+    for name in names:
+        normalized = normalize_name(name)
+        if normalized in seen:
+            continue
+        seen.add(normalized)
+        if matcher.fullmatch(normalized):
+            for pattern, regex in zip(patterns, compiled):
+                if regex.fullmatch(normalized):
+                    matches[pattern].append((normalized, name))
+    return {pattern: [name for _, name in sorted(found)]
+            for pattern, found in matches.items()}
+
+
+@functools.lru_cache(maxsize=32)
+def _compile_patterns(patterns):
+    """Return the combined regular expression of `patterns` and the
+    regular expression of each."""
+    import fnmatch
+
+    regexes = []
+    for pattern in patterns:
+        if pattern.startswith(REGEX_PREFIX):
+            regex = pattern[len(REGEX_PREFIX):]
+        else:
+            regex = fnmatch.translate(normalize_name(pattern))
+        try:
+            regexes.append(re.compile(regex, re.IGNORECASE))
+        except re.error as e:
+            raise ValueError(
+                f"invalid pattern {pattern!r}: {e}") from None
+    try:
+        combined = re.compile(
+            "|".join(f"(?:{regex.pattern})" for regex in regexes),
+            re.IGNORECASE)
+    except re.error as e:
+        # e.g., global flags such as `(?i)` are only valid at the start
+        raise ValueError(f"invalid package patterns: {e}") from None
+    return combined, regexes
+
+
+def _read_name_version(dist):
+    """Read only the Name and Version headers of a distribution."""
+    path = getattr(dist, "_path", None)
+    if path is not None:
+        for filename in ("METADATA", "PKG-INFO"):
+            try:
+                with open(os.path.join(path, filename),
+                          encoding="utf-8", errors="replace") as f:
+                    return _parse_headers(f)
+            except OSError:
+                continue
+    metadata = dist.metadata
+    return metadata["Name"], metadata["Version"]
+
+
+def _parse_headers(lines):
+    name = version = None
+    for line in lines:
+        if not line.strip():
+            break  # end of the header block
+        key, _, value = line.partition(":")
+        key = key.lower()
+        if key == "name" and name is None:
+            name = value.strip()
+        elif key == "version" and version is None:
+            version = value.strip()
+        if name and version:
+            break
+    return name, version
+
+
+# Cached distribution digests of sys.path entries, by path.
+_digests_lock = threading.Lock()
+_digests = None
+_DIGESTS_FILE = "path-digests.json"
+
+
+def path_digests(paths):
+    """Return `[(path, digest)]` of the distributions installed in each
+    of `paths`, or `(path, None)` for entries without any.
+
+    A digest covers the sorted `name-version` stems of the `*.dist-info`
+    and `*.egg-info` entries of the directory. Digests are cached in
+    memory and on disk by directory mtime, which changes whenever a
+    distribution is installed, upgraded or removed; for an unchanged
+    environment this costs one `stat` per path.
+    """
+    global _digests
+    with _digests_lock:
+        if _digests is None:
+            from . import cache
+
+            _digests = cache.load_json(_DIGESTS_FILE) or {}
+        digests = _digests
+    result, changed = [], {}
+    for path in paths:
+        try:
+            mtime = os.stat(path or ".").st_mtime_ns
+        except OSError:
+            continue
+        cached = digests.get(path)
+        if cached is None or cached[0] != mtime:
+            cached = changed[path] = [mtime, _directory_digest(path)]
+        result.append((path, cached[1]))
+    if changed:
+        from . import cache
+
+        # Another thread may be dumping the shared dict, so it is only
+        # updated under the lock
+        with _digests_lock:
+            digests.update(changed)
+            cache.dump_json(_DIGESTS_FILE, digests)
+    return result
+
+
+def _directory_digest(path):
+    import hashlib
+
+    try:
+        entries = sorted(_dist_stems(path))
+    except OSError:  # not a directory, e.g., a zip file
+        return None
+    if not entries:
+        return None
+    return hashlib.sha256("\n".join(entries).encode("utf-8")).hexdigest()
+
+
+def _dist_stems(path):
+    """Yield the normalized `name-version` stems of the distributions
+    in the directory `path`."""
+    with os.scandir(path or ".") as entries:
+        for entry in entries:
+            stem, ext = os.path.splitext(entry.name)
+            if ext in (".dist-info", ".egg-info") and "-" in stem:
+                name, version = stem.split("-")[:2]
+                yield f"{normalize_name(name)}-{version}"
+
+
+_VERSION_NAMES = ("__version__", "version", "VERSION")
+_VERSION_MODULES = ("version", "_version", "__about__", "__version__")
+
+
+def find_static_version(module_name):
+    """Return the version string of a top-level module without importing
+    it, or None.
+
+    The module is located with `importlib.util.find_spec` and its
+    source (and that of a `version.py`/`_version.py`/`__about__.py`
+    next to it) is parsed for a literal `__version__` assignment.
+    """
+    import importlib.util
+
+    if "." in module_name:
+        # find_spec() would import the parent packages
+        return None
+    try:
+        spec = importlib.util.find_spec(module_name)
+    except (ImportError, ValueError):
+        return None
+    if spec is None or not spec.origin or not spec.origin.endswith(".py"):
+        return None
+
+    version = _version_from_source(spec.origin)
+    if version is None and spec.submodule_search_locations:
+        package_dir = os.path.dirname(spec.origin)
+        for candidate in _VERSION_MODULES:
+            path = os.path.join(package_dir, candidate + ".py")
+            if os.path.isfile(path):
+                version = _version_from_source(path)
+                if version is not None:
+                    break
+    return version
+
+
+def _version_from_source(path, names=_VERSION_NAMES, depth=0):
+    import ast
+
+    try:
+        with open(path, "rb") as f:
+            tree = ast.parse(f.read(), filename=path)
+    except (OSError, SyntaxError, ValueError):
+        return None
+
+    found = {}
+    for node in tree.body:
+        if isinstance(node, ast.Assign):
+            targets, value = node.targets, node.value
+        elif isinstance(node, ast.AnnAssign) and node.value is not None:
+            targets, value = [node.target], node.value
+        elif isinstance(node, ast.ImportFrom) and node.level == 1 \
+                and depth < 2:
+            # e.g. `from ._version import version as __version__`
+            for alias in node.names:
+                if (alias.asname or alias.name) in names and node.module:
+                    source = os.path.join(os.path.dirname(path),
+                                          *node.module.split(".")) + ".py"
+                    value = _version_from_source(source, (alias.name,),
+                                                 depth + 1)
+                    if value is not None:
+                        found.setdefault(alias.asname or alias.name, value)
+            continue
+        else:
+            continue
+        value = _string_literal(value)
+        if value is None:
+            continue
+        for target in targets:
+            if isinstance(target, ast.Name) and target.id in names:
+                found[target.id] = value
+
+    for name in names:
+        if name in found:
+            return found[name]
+    return None
+
+
+def _string_literal(node):
+    import ast
+
+    if isinstance(node, ast.Constant) and isinstance(node.value, str):
+        return node.value
+    if sys.version_info < (3, 8) and isinstance(node, ast.Str):
+        # Python 3.7 parses string literals as ast.Str
+        return node.s
+    return None
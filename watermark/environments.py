@@ -0,0 +1,219 @@
+# -*- coding: utf-8 -*-
+"""
+Survey of the Python versions, installation type and package versions of
+other interpreters and environments (venvs, conda environments).
+
+Each interpreter runs a small probe script that only uses `sys`, `os` and
+`json`: it neither imports watermark nor the surveyed packages, and reads
+package versions from the names of the `*.dist-info`/`*.egg-info`
+directories on its `sys.path`. The probes run as concurrent child
+processes, at most `max_workers` at a time.
+
+License: BSD 3 clause
+"""
+
+import json
+import os
+import subprocess
+
+
+# Kept compatible with old Python 3 versions, since the surveyed
+# interpreters may be much older than the one running watermark.
+_PROBE = r"""
+import json, os, sys
+
+def norm(name):
+    name = name.lower()
+    for c in "_.":
+        name = name.replace(c, "-")
+    while "--" in name:
+        name = name.replace("--", "-")
+    return name
+
+wanted = {}
+for n in json.loads(sys.argv[1]):
+    wanted.setdefault(norm(n), []).append(n)
+found = {}
+dists = []
+for entry in sys.path:
+    if not entry or not os.path.isdir(entry):
+        continue
+    for fn in sorted(os.listdir(entry)):
+        base, ext = os.path.splitext(fn)
+        if ext not in (".dist-info", ".egg-info") or "-" not in base:
+            continue
+        name, version = base.split("-")[:2]
+        name = norm(name)
+        dists.append((os.path.join(entry, fn), version))
+        for requested in wanted.get(name, ()):
+            found.setdefault(requested, version)
+
+# Module names such as `sklearn` map to a distribution via top_level.txt
+missing = set(n for names in wanted.values() for n in names) - set(found)
+for path, version in dists if missing else ():
+    try:
+        with open(os.path.join(path, "top_level.txt")) as f:
+            modules = f.read().split()
+    except (IOError, OSError):
+        continue
+    for module in modules:
+        if module in missing:
+            found[module] = version
+            missing.discard(module)
+
+level = sys.version_info[3]
+version = "%d.%d.%d" % sys.version_info[:3]
+if level != "final":
+    version += {"alpha": "a", "beta": "b", "candidate": "rc"}.get(
+        level, level) + str(sys.version_info[4])
+names = {"cpython": "CPython", "pypy": "PyPy", "ironpython": "IronPython",
+         "jython": "Jython"}
+implementation = getattr(sys, "implementation", None)
+implementation = implementation.name if implementation else "cpython"
+virtual = hasattr(sys, "real_prefix") or (
+    getattr(sys, "base_prefix", sys.prefix) != sys.prefix)
+sys.stdout.write(json.dumps({
+    "implementation": names.get(implementation, implementation),
+    "version": version,
+    "executable": sys.executable,
+    "virtual": virtual,
+    "packages": found,
+}))
+"""
+
+
+def find_interpreter(target):
+    """Return the interpreter of `target`, which is either the path of
+    an interpreter or the prefix of an environment."""
+    if not os.path.isdir(target):
+        return target
+    if os.name == "nt":
+        candidates = ["python.exe", os.path.join("Scripts", "python.exe")]
+    else:
+        candidates = [os.path.join("bin", "python"),
+                      os.path.join("bin", "python3")]
+    for candidate in candidates:
+        path = os.path.join(target, candidate)
+        if os.path.isfile(path):
+            return path
+    raise FileNotFoundError(f"no Python interpreter found in {target}")
+
+
+def probe(target, packages=(), timeout=None):
+    """Return the watermark sections of the interpreter or environment
+    `target` as a dict, or `{"error": "n/a (<reason>)"}`."""
+    from .watermark import _classify_python_installation
+
+    try:
+        interpreter = find_interpreter(target)
+        # -E: ignore PYTHONPATH and friends meant for this interpreter
+        result = subprocess.run(
+            [interpreter, "-E", "-c", _PROBE,
+             json.dumps(list(packages) + ["ipython"])],
+            stdin=subprocess.DEVNULL, capture_output=True, timeout=timeout,
+        )
+    except subprocess.TimeoutExpired:
+        return {"error": "n/a (timed out)"}
+    except OSError as e:
+        return {"error": f"n/a ({e.strerror or e})"}
+    if result.returncode != 0:
+        message = result.stderr.decode(errors="replace").strip()
+        message = message.splitlines()[-1] if message else "probe failed"
+        return {"error": f"n/a ({message})"}
+    facts = json.loads(result.stdout)
+
+    dists = {name.lower(): version
+             for name, version in facts["packages"].items()}
+    return {
+        "python": {
+            "Python implementation": facts["implementation"],
+            "Python version": facts["version"],
+            "IPython version": dists.get("ipython", "not installed"),
+        },
+        "python_installation": {
+            "Python installation": _classify_python_installation(
+                facts["executable"], facts["virtual"]),
+        },
+        "packages": {package: facts["packages"].get(package, "unknown")
+                     for package in packages},
+    }
+
+
+def survey(targets, packages=None, max_workers=None, timeout=None,
+           output_format="text"):
+    """Collect the watermark of several interpreters or environments.
+
+    Parameters
+    ----------
+    targets : list of str
+        Interpreter paths (e.g., `/usr/bin/python3.9`) or environment
+        prefixes (e.g., `~/.venvs/x` or a conda environment).
+
+    packages : str (default: None)
+        Comma-separated packages whose versions are reported.
+
+    max_workers : int (default: None)
+        Maximum number of probes that run at once; defaults to the
+        number of CPUs.
+
+    timeout : float (default: None)
+        Time limit in seconds for each probe.
+
+    output_format : str (default: "text")
+        `"text"` returns one table with a row per target, `"dict"` the
+        sections of each target keyed by target and `"json"` the same
+        as a JSON string.
+
+    Returns
+    -------
+    The report in the requested `output_format`.
+    """
+    if output_format not in ("text", "dict", "json"):
+        raise ValueError(
+            f"output_format must be 'text', 'dict' or 'json', "
+            f"not {output_format!r}")
+    targets = list(targets)
+    packages = [p.strip() for p in (packages or "").split(",") if p.strip()]
+    if max_workers is None:
+        max_workers = os.cpu_count() or 1
+    max_workers = max(1, min(max_workers, len(targets) or 1))
+
+    from concurrent.futures import ThreadPoolExecutor
+
+    # Each probe is a child process, so threads that wait for them are
+    # enough to keep `max_workers` interpreters busy
+    with ThreadPoolExecutor(max_workers=max_workers) as ex:
+        reports = list(ex.map(
+            lambda target: probe(target, packages, timeout), targets))
+    reports = dict(zip(targets, reports))
+
+    if output_format == "dict":
+        return reports
+    if output_format == "json":
+        return json.dumps(reports)
+    return format_table(reports, packages)
+
+
+def format_table(reports, packages=()):
+    """Format `survey()` results as a table with a row per target."""
+    header = ["Environment", "Python", "Implementation", "IPython",
+              "Installation"] + list(packages)
+    rows = [header]
+    for target, report in reports.items():
+        if "error" in report:
+            rows.append([target, report["error"]])
+            continue
+        python = report["python"]
+        rows.append([target, python["Python version"],
+                     python["Python implementation"],
+                     python["IPython version"],
+                     report["python_installation"]["Python installation"]]
+                    + [report["packages"][package] for package in packages])
+    # Error messages span the remaining columns
+    widths = [max(len(row[i]) for row in rows if len(row) == len(header))
+              for i in range(len(header))]
+    return "\n".join(
+        "  ".join(cell.ljust(width) for cell, width in zip(row, widths))
+        .rstrip()
+        for row in rows
+    )
@@ -0,0 +1,466 @@
+# -*- coding: utf-8 -*-
+"""
+Read Git metadata (commit hash, branch, remote URL and a dirty flag)
+directly from the repository files instead of spawning `git`.
+
+Plain repositories, linked worktrees and `.git` files with a
+`gitdir:` pointer (submodules) are read in a single pass. Layouts only
+git itself understands (reftable, config includes, GIT_DIR overrides,
+bare repositories) fall back to the `git` executable.
+
+License: BSD 3 clause
+"""
+
+import os
+import re
+import struct
+import time
+
+
+# Environment variables that change how git locates the repository.
+_GIT_ENV_OVERRIDES = (
+    "GIT_DIR",
+    "GIT_WORK_TREE",
+    "GIT_COMMON_DIR",
+    "GIT_INDEX_FILE",
+    "GIT_CONFIG",
+    "GIT_CONFIG_GLOBAL",
+    "GIT_CONFIG_SYSTEM",
+    "GIT_CEILING_DIRECTORIES",
+)
+
+_SECTION_RE = re.compile(
+    r'^\[\s*([A-Za-z0-9.-]+)(?:\s+"((?:[^"\\]|\\.)*)")?\s*\]'
+)
+_SHA_RE = re.compile(r"^[0-9a-f]{40}([0-9a-f]{24})?$")
+
+
+class GitLayoutError(Exception):
+    """Raised for repository layouts that this reader does not handle."""
+
+
+def read_git_info(path=None, dirty=False, timeout=None):
+    """Return a dict with the `hash`, `branch` and `remote` of the
+    repository containing `path` (default: the current directory).
+
+    If `dirty` is True, a `dirty` entry is added as well. Values that
+    cannot be determined are reported as "n/a (<reason>)". `timeout`
+    bounds the total time spent in `git` subprocesses (if any are
+    needed); processes still running at the deadline are killed.
+    """
+    try:
+        return _read_git_files(path, dirty)
+    except (GitLayoutError, OSError, ValueError, struct.error):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        return _read_git_subprocess(path, dirty, deadline)
+
+
+def find_git_dir(path=None):
+    """Return `(git_dir, common_dir, work_tree)` for `path` or None if
+    `path` is not inside a Git work tree."""
+    if any(var in os.environ for var in _GIT_ENV_OVERRIDES):
+        raise GitLayoutError("git environment overrides are set")
+    current = os.path.abspath(path or os.getcwd())
+    while True:
+        candidate = os.path.join(current, ".git")
+        if os.path.isdir(candidate):
+            git_dir = candidate
+            break
+        if os.path.isfile(candidate):
+            with open(candidate, encoding="utf-8") as f:
+                content = f.read().strip()
+            if not content.startswith("gitdir:"):
+                raise GitLayoutError(f"unrecognized .git file {candidate}")
+            git_dir = os.path.normpath(
+                os.path.join(current, content[len("gitdir:"):].strip()))
+            break
+        if os.path.isfile(os.path.join(current, "HEAD")) and \
+                os.path.isdir(os.path.join(current, "objects")):
+            raise GitLayoutError("bare repository")
+        parent = os.path.dirname(current)
+        if parent == current:
+            return None
+        current = parent
+
+    common_dir = git_dir
+    commondir_file = os.path.join(git_dir, "commondir")
+    if os.path.isfile(commondir_file):
+        with open(commondir_file, encoding="utf-8") as f:
+            common_dir = os.path.normpath(
+                os.path.join(git_dir, f.read().strip()))
+    if os.path.isdir(os.path.join(common_dir, "reftable")):
+        raise GitLayoutError("reftable ref storage")
+    return git_dir, common_dir, current
+
+
+class HeadSignature:
+    """Callable returning a cheap token that changes when the checked-out
+    commit or branch, or the index, of the repository containing `path`
+    changes (None outside of a repository).
+
+    The token consists of the mtimes of `HEAD`, the index, `packed-refs`
+    and the checked-out ref, so each call takes a few `stat` calls; `HEAD`
+    is only read again when its mtime changes.
+    """
+
+    def __init__(self, path=None):
+        try:
+            self.dirs = find_git_dir(path)
+        except (GitLayoutError, OSError, ValueError):
+            self.dirs = None
+        self._head_mtime = None
+        self._paths = ()
+
+    def __call__(self):
+        if self.dirs is None:
+            return None
+        git_dir, common_dir, _ = self.dirs
+        head_mtime = _mtime(os.path.join(git_dir, "HEAD"))
+        if head_mtime != self._head_mtime:
+            self._head_mtime = head_mtime
+            self._paths = self._watched_paths(git_dir, common_dir)
+        return (head_mtime,) + tuple(_mtime(path) for path in self._paths)
+
+    @staticmethod
+    def _watched_paths(git_dir, common_dir):
+        paths = [os.path.join(git_dir, "index"),
+                 os.path.join(common_dir, "packed-refs")]
+        try:
+            with open(os.path.join(git_dir, "HEAD"), encoding="utf-8") as f:
+                head = f.read().strip()
+        except OSError:
+            return paths
+        if head.startswith("ref:"):
+            ref = head[len("ref:"):].strip().split("/")
+            # Per-worktree refs live in the worktree's git dir
+            ref_path = os.path.join(git_dir, *ref)
+            if not os.path.exists(ref_path):
+                ref_path = os.path.join(common_dir, *ref)
+            paths.append(ref_path)
+        return paths
+
+
+def _mtime(path):
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
+
+def _read_git_files(path, dirty):
+    dirs = find_git_dir(path)
+    if dirs is None:
+        reason = "n/a (not a git repository)"
+        info = {"hash": reason, "branch": reason, "remote": reason}
+        if dirty:
+            info["dirty"] = reason
+        return info
+    git_dir, common_dir, work_tree = dirs
+
+    with open(os.path.join(git_dir, "HEAD"), encoding="utf-8") as f:
+        head = f.read().strip()
+    if head.startswith("ref:"):
+        ref = head[len("ref:"):].strip()
+        branch = ref[len("refs/heads/"):] \
+            if ref.startswith("refs/heads/") else ref
+        commit = _resolve_ref(git_dir, common_dir, ref)
+    elif _SHA_RE.match(head):
+        branch, commit = "HEAD", head
+    else:
+        raise GitLayoutError("unrecognized HEAD")
+
+    info = {
+        "hash": commit or "n/a (no commits yet)",
+        "branch": branch,
+        "remote": _read_remote_url(common_dir) or "n/a (no origin remote)",
+    }
+    if dirty:
+        info["dirty"] = _index_is_dirty(git_dir, work_tree)
+    return info
+
+
+def _resolve_ref(git_dir, common_dir, ref, depth=0):
+    if depth > 5:
+        raise GitLayoutError(f"symbolic ref loop at {ref}")
+    # Per-worktree refs live in the worktree's git dir, shared ones in
+    # the common dir.
+    for base in (git_dir, common_dir):
+        ref_path = os.path.join(base, *ref.split("/"))
+        if os.path.isfile(ref_path):
+            with open(ref_path, encoding="utf-8") as f:
+                value = f.read().strip()
+            if value.startswith("ref:"):
+                return _resolve_ref(git_dir, common_dir,
+                                    value[len("ref:"):].strip(), depth + 1)
+            return value
+    return _find_packed_ref(common_dir, ref)
+
+
+def _find_packed_ref(common_dir, ref):
+    # Repositories with many tags can have large packed-refs files, so
+    # search for the single line instead of parsing all of them.
+    try:
+        with open(os.path.join(common_dir, "packed-refs"), "rb") as f:
+            data = f.read()
+    except FileNotFoundError:
+        return None
+    needle = b" " + ref.encode("utf-8") + b"\n"
+    end = data.find(needle)
+    while end != -1:
+        start = data.rfind(b"\n", 0, end) + 1
+        sha = data[start:end].decode("ascii", "replace")
+        if _SHA_RE.match(sha):
+            return sha
+        end = data.find(needle, end + 1)
+    if data.endswith(needle[:-1]):  # last line without a newline
+        start = data.rfind(b"\n") + 1
+        sha = data[start:len(data) - len(needle) + 1].decode("ascii",
+                                                              "replace")
+        if _SHA_RE.match(sha):
+            return sha
+    return None
+
+
+def _read_remote_url(common_dir, remote="origin"):
+    url = None
+    in_remote = False
+    with open(os.path.join(common_dir, "config"), encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line or line[0] in "#;":
+                continue
+            if line.startswith("["):
+                match = _SECTION_RE.match(line)
+                if match is None:
+                    raise GitLayoutError(f"unrecognized config line {line}")
+                section = match.group(1).lower()
+                if section in ("include", "includeif"):
+                    raise GitLayoutError("config includes")
+                subsection = match.group(2)
+                if subsection is None and section.startswith("remote."):
+                    # Legacy `[remote.origin]` syntax
+                    section, subsection = "remote", section[len("remote."):]
+                in_remote = section == "remote" and subsection == remote
+                continue
+            if in_remote:
+                key, sep, value = line.partition("=")
+                if sep and key.strip().lower() == "url":
+                    url = _parse_config_value(value)
+    return url
+
+
+def _parse_config_value(value):
+    value = value.strip()
+    if value.startswith('"'):
+        return value[1:value.index('"', 1)]
+    for comment in (" #", " ;", "\t#", "\t;"):
+        value = value.split(comment, 1)[0]
+    return value.strip()
+
+
+def _index_is_dirty(git_dir, work_tree):
+    """Compare the stat data recorded in the index with the work tree.
+
+    This is the cheap check `git status` performs before hashing file
+    contents: a tracked file that is missing or whose size or mtime
+    changed counts as modified. Untracked files and changes that are
+    already staged are not considered, and files that were merely
+    touched are reported as modified.
+    """
+    try:
+        with open(os.path.join(git_dir, "index"), "rb") as f:
+            data = f.read()
+    except FileNotFoundError:
+        return False
+    signature, index_version, n_entries = struct.unpack_from(">4sLL", data)
+    if signature != b"DIRC" or index_version not in (2, 3, 4):
+        raise GitLayoutError(f"unsupported index version {index_version}")
+
+    offset = 12
+    previous = b""
+    for _ in range(n_entries):
+        (_, _, mtime_s, mtime_ns, _, _, mode, _, _, size) = \
+            struct.unpack_from(">10L", data, offset)
+        flags, = struct.unpack_from(">H", data, offset + 60)
+        pos = offset + 62
+        extended = 0
+        if flags & 0x4000:
+            extended, = struct.unpack_from(">H", data, pos)
+            pos += 2
+        if index_version == 4:
+            strip, pos = _read_varint(data, pos)
+            end = data.index(b"\0", pos)
+            name = previous[:len(previous) - strip] + data[pos:end]
+            offset = end + 1
+        else:
+            end = data.index(b"\0", pos)
+            name = data[pos:end]
+            offset += (pos - offset + len(name) + 8) & ~7
+        previous = name
+
+        if (flags >> 12) & 0x3:
+            return True  # unmerged entry
+        if extended & 0x2000:
+            return True  # intent-to-add
+        if flags & 0x8000 or extended & 0x4000:
+            continue  # assume-unchanged or skip-worktree
+        if mode >> 12 == 0o16:
+            continue  # submodule
+        try:
+            st = os.lstat(os.path.join(work_tree, os.fsdecode(name)))
+        except FileNotFoundError:
+            return True
+        if (st.st_size & 0xFFFFFFFF) != size or int(st.st_mtime) != mtime_s:
+            return True
+        if mtime_ns and st.st_mtime_ns % 1_000_000_000 != mtime_ns:
+            return True
+    return False
+
+
+def _read_varint(data, pos):
+    # Offset encoding used by index v4 path compression.
+    byte = data[pos]
+    pos += 1
+    value = byte & 0x7F
+    while byte & 0x80:
+        byte = data[pos]
+        pos += 1
+        value = ((value + 1) << 7) | (byte & 0x7F)
+    return value, pos
+
+
+def _git_queries(dirty):
+    """`(key, git arguments, value if unset)` for the subprocess path."""
+    queries = [
+        ("hash", ["rev-parse", "HEAD"], None),
+        ("branch", ["rev-parse", "--abbrev-ref", "HEAD"], None),
+        ("remote", ["config", "--get", "remote.origin.url"],
+         "n/a (no origin remote)"),
+    ]
+    if dirty:
+        queries.append(
+            ("dirty", ["status", "--porcelain", "--untracked-files=no"], None))
+    return queries
+
+
+def _git_output(returncode, stdout, stderr, missing):
+    if returncode != 0:
+        message = stderr.decode("utf-8", "replace").strip().splitlines()
+        if not message and missing is not None:
+            return missing
+        return f"n/a ({message[0] if message else 'git failed'})"
+    return stdout.decode("utf-8").strip()
+
+
+def _git_info(values):
+    info = dict(values)
+    if "dirty" in info and not info["dirty"].startswith("n/a"):
+        info["dirty"] = bool(info["dirty"])
+    return info
+
+
+def _run_git(args, path, missing=None, deadline=None):
+    """Run git and return stripped stdout or "n/a (<reason>)".
+
+    `missing` is returned when git exits with an error but no message,
+    which is how `git config --get` reports an unset key. A process
+    that is still running at `deadline` (a `time.monotonic()` value) is
+    killed.
+    """
+    # Only imported when the repository files cannot be read directly
+    import subprocess
+
+    timeout = None
+    if deadline is not None:
+        timeout = deadline - time.monotonic()
+        if timeout <= 0:
+            return "n/a (timed out)"
+    try:
+        process = subprocess.Popen(
+            ["git"] + args, shell=False, cwd=path,
+            stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+            # Own process group, so that helpers git spawned can be
+            # killed along with it
+            start_new_session=deadline is not None and os.name == "posix",
+        )
+    except FileNotFoundError:
+        return "n/a (git executable not found)"
+    try:
+        stdout, stderr = process.communicate(timeout=timeout)
+    except subprocess.TimeoutExpired:
+        _kill(process)
+        process.communicate()
+        return "n/a (timed out)"
+    return _git_output(process.returncode, stdout, stderr, missing)
+
+
+def _kill(process):
+    if os.name == "posix" and process.pid:
+        import signal
+        try:
+            os.killpg(process.pid, signal.SIGKILL)
+            return
+        except OSError:
+            pass
+    try:
+        process.kill()
+    except ProcessLookupError:
+        pass
+
+
+def _read_git_subprocess(path, dirty, deadline=None):
+    return _git_info(
+        (key, _run_git(args, path, missing=missing, deadline=deadline))
+        for key, args, missing in _git_queries(dirty)
+    )
+
+
+async def aread_git_info(path=None, dirty=False, timeout=None):
+    """Coroutine version of `read_git_info()`.
+
+    The repository files are read directly; if `git` is needed, the
+    queries run concurrently via `asyncio.create_subprocess_exec`.
+    """
+    try:
+        return _read_git_files(path, dirty)
+    except (GitLayoutError, OSError, ValueError, struct.error):
+        import asyncio
+
+        deadline = None if timeout is None else time.monotonic() + timeout
+        queries = _git_queries(dirty)
+        values = await asyncio.gather(*(
+            _arun_git(args, path, missing, deadline)
+            for _, args, missing in queries
+        ))
+        return _git_info(zip((key for key, _, _ in queries), values))
+
+
+async def _arun_git(args, path, missing=None, deadline=None):
+    """Coroutine version of `_run_git()`."""
+    import asyncio
+    import subprocess
+
+    timeout = None
+    if deadline is not None:
+        timeout = deadline - time.monotonic()
+        if timeout <= 0:
+            return "n/a (timed out)"
+    try:
+        process = await asyncio.create_subprocess_exec(
+            "git", *args, cwd=path,
+            stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+            start_new_session=os.name == "posix",
+        )
+    except FileNotFoundError:
+        return "n/a (git executable not found)"
+    try:
+        stdout, stderr = await asyncio.wait_for(process.communicate(),
+                                                timeout)
+    except asyncio.TimeoutError:
+        _kill(process)
+        await process.wait()
+        return "n/a (timed out)"
+    except asyncio.CancelledError:
+        _kill(process)
+        raise
+    return _git_output(process.returncode, stdout, stderr, missing)
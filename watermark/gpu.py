@@ -0,0 +1,186 @@
+# -*- coding: utf-8 -*-
+"""
+NVIDIA GPU inventory via NVML.
+
+NVML is initialized once per process and kept open, since `nvmlInit()`
+is by far the most expensive call when GPUs are queried repeatedly
+(e.g., for every training step). The session is shut down at interpreter
+exit or explicitly via `shutdown()`, and re-initialized in forked
+children. Facts that cannot change while the session is open (names,
+UUIDs, PCI bus IDs, total memory, driver versions) are read once; only
+memory usage and utilization are queried on later calls.
+
+The NVML bindings default to `py3nvml`; any object with the same
+functions (e.g., a fake for tests) can be used via `set_backend()`.
+
+License: BSD 3 clause
+"""
+
+import atexit
+import os
+import threading
+
+
+_lock = threading.Lock()
+_session = None
+_backend = None
+
+
+def _default_backend():
+    try:
+        from py3nvml import py3nvml
+    except ImportError:
+        py3nvml = None
+    return py3nvml
+
+
+def set_backend(backend):
+    """Use `backend` (a module like `py3nvml.py3nvml`) for NVML calls;
+    `None` restores the default. An open session is shut down."""
+    global _backend
+    shutdown()
+    with _lock:
+        _backend = backend
+
+
+def get_session():
+    """Return the process-wide `NVMLSession`, or None if no NVML
+    bindings are installed."""
+    global _session
+    with _lock:
+        if _session is None:
+            backend = _backend if _backend is not None \
+                else _default_backend()
+            if backend is None:
+                return None
+            _session = NVMLSession(backend)
+        return _session
+
+
+def shutdown():
+    """Shut down the process-wide NVML session, if any."""
+    global _session
+    with _lock:
+        session, _session = _session, None
+    if session is not None:
+        session.close()
+
+
+atexit.register(shutdown)
+
+
+class GPUDevices(list):
+    """List of per-device dicts that prints as one line per GPU."""
+
+    def __str__(self):
+        lines = [""]
+        for device in self:
+            line = f"GPU {device['index']}: {device['name']}"
+            if device.get("memory_total"):
+                line += (f" ({_gib(device['memory_used'])}/"
+                         f"{_gib(device['memory_total'])} GiB")
+                if device.get("utilization_gpu") is not None:
+                    line += f", {device['utilization_gpu']}% utilization"
+                line += ")"
+            lines.append(line)
+        return "\n  ".join(lines)
+
+
+def _gib(value):
+    return "?" if value is None else f"{value / 2**30:.1f}"
+
+
+class NVMLSession:
+    """An NVML session of the current process."""
+
+    def __init__(self, backend):
+        self.backend = backend
+        self._lock = threading.Lock()
+        self._pid = None
+        self._static = None
+
+    def open(self):
+        if self._pid != os.getpid():
+            # Handles are not valid in a forked child; start over
+            self._static = None
+            self.backend.nvmlInit()
+            self._pid = os.getpid()
+
+    def close(self):
+        with self._lock:
+            if self._pid == os.getpid():
+                self._pid = None
+                self._static = None
+                self.backend.nvmlShutdown()
+
+    def __enter__(self):
+        with self._lock:
+            self.open()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def inventory(self):
+        """Return `{"devices": GPUDevices, "driver_version": ...,
+        "cuda_version": ...}` in one pass over all devices."""
+        with self._lock:
+            self.open()
+            if self._static is None:
+                self._static = self._read_static()
+            static = self._static
+            nvml = self.backend
+            devices = GPUDevices()
+            for handle, facts in zip(static["handles"], static["devices"]):
+                device = dict(facts)
+                memory = _query(nvml, "nvmlDeviceGetMemoryInfo", handle)
+                device["memory_used"] = getattr(memory, "used", None)
+                rates = _query(nvml, "nvmlDeviceGetUtilizationRates", handle)
+                device["utilization_gpu"] = getattr(rates, "gpu", None)
+                device["utilization_memory"] = getattr(rates, "memory", None)
+                devices.append(device)
+        return {"devices": devices,
+                "driver_version": static["driver_version"],
+                "cuda_version": static["cuda_version"]}
+
+    def _read_static(self):
+        nvml = self.backend
+        handles, devices = [], []
+        for i in range(nvml.nvmlDeviceGetCount()):
+            handle = nvml.nvmlDeviceGetHandleByIndex(i)
+            memory = _query(nvml, "nvmlDeviceGetMemoryInfo", handle)
+            pci = _query(nvml, "nvmlDeviceGetPciInfo", handle)
+            handles.append(handle)
+            devices.append({
+                "index": i,
+                "name": _text(nvml.nvmlDeviceGetName(handle)),
+                "uuid": _text(_query(nvml, "nvmlDeviceGetUUID", handle)),
+                "pci_bus_id": _text(getattr(pci, "busId", None)),
+                "memory_total": getattr(memory, "total", None),
+            })
+        cuda = _query(nvml, "nvmlSystemGetCudaDriverVersion")
+        return {
+            "handles": handles,
+            "devices": devices,
+            "driver_version": _text(_query(nvml,
+                                           "nvmlSystemGetDriverVersion")),
+            # e.g., 12020 for CUDA 12.2
+            "cuda_version": None if cuda is None
+            else f"{cuda // 1000}.{cuda % 1000 // 10}",
+        }
+
+
+def _query(nvml, name, *args):
+    """Return `nvml.<name>(*args)`, or None if the query is not
+    supported by the device or the bindings."""
+    func = getattr(nvml, name, None)
+    if func is None:
+        return None
+    try:
+        return func(*args)
+    except Exception:
+        return None
+
+
+def _text(value):
+    return value.decode() if isinstance(value, bytes) else value
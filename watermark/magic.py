@@ -6,6 +6,9 @@ Author: Sebastian Raschka <sebastianraschka.com>
 License: BSD 3 clause
 """
 
+import re
+import sys
+
 from IPython.core.magic import Magics
 from IPython.core.magic import magics_class
 from IPython.core.magic import line_magic
@@ -13,89 +16,160 @@ from IPython.core.magic_arguments import argument
 from IPython.core.magic_arguments import magic_arguments
 from IPython.core.magic_arguments import parse_argstring
 
-from watermark import watermark
+from watermark import distributions
+from watermark import gitinfo
+from watermark.cli import ARGUMENTS
+from watermark.cli import to_watermark_kwargs
+from watermark.watermark import ImportTracker
+from watermark.watermark import _TRACKED_TYPES
+from watermark.watermark import _format_diff
+from watermark.watermark import _generate_formatted_text
+from watermark.watermark import watermark as _watermark
 
 
 class PackageNotFoundError(Exception):
     pass
 
 
+def _arguments(func):
+    """Add the arguments shared with the command line interface."""
+    # Applied bottom-up like stacked @argument decorators
+    for flags, kwargs in reversed(ARGUMENTS):
+        func = argument(*flags, **kwargs)(func)
+    return func
+
+
+# Sections that may change while the kernel runs, by the kind of change
+# that affects them.
+_WATCHED_SECTIONS = {
+    "imports": ("iversions",),
+    "distributions": ("packages", "iversions", "fingerprint"),
+    "git": ("git_hash", "git_repo", "git_branch", "git_dirty",
+            "fingerprint"),
+}
+
+
+# Input and output history entries that IPython adds after every cell
+_HISTORY_NAME = re.compile(r"_(\d+|i\d*|ii|iii|_|__)?")
+
+
+def _namespace_ids(ns):
+    """Return the `id()`s of the modules, classes and functions bound in
+    `ns`, which determine its `--iversions`, by name."""
+    return {name: id(val) for name, val in dict(ns).items()
+            if isinstance(val, _TRACKED_TYPES)
+            and not _HISTORY_NAME.fullmatch(name)}
+
+
+class _Watcher:
+    """`post_run_cell` hook of `%watermark --watch`.
+
+    After each cell, it checks the number of loaded modules, the
+    modules, classes and functions bound in the user namespace, the
+    mtimes of the `sys.path` directories and the Git HEAD signature,
+    each only if a section it affects is watched. Only if one of them
+    changed are the affected sections collected again and the keys that
+    changed printed. With `--iversions`, every cell costs a pass over
+    the user namespace, i.e., time proportional to its size.
+    """
+
+    def __init__(self, args):
+        self.args = args
+        self.user_ns = args['watermark_self'].shell.user_ns
+        self.head_signature = gitinfo.HeadSignature()
+        self.sections = _watermark(**dict(args, output_format="dict"))
+        probes = {
+            "imports": self._imports_state,
+            "distributions": lambda: distributions._paths_key(sys.path),
+            "git": self.head_signature,
+        }
+        self.probes = {kind: probe for kind, probe in probes.items()
+                       if any(name in self.sections
+                              for name in _WATCHED_SECTIONS[kind])}
+        self.state = self._state()
+
+    def _imports_state(self):
+        return len(sys.modules), _namespace_ids(self.user_ns)
+
+    def _state(self):
+        return {kind: probe() for kind, probe in self.probes.items()}
+
+    def __call__(self, result=None):
+        state = self._state()
+        if state == self.state:
+            return
+        changed = set()
+        for kind, value in state.items():
+            if value != self.state[kind]:
+                changed.update(_WATCHED_SECTIONS[kind])
+        self.state = state
+        baseline = {name: self.sections[name]
+                    for name in self.sections if name in changed}
+        if not baseline:
+            return
+        diff = _watermark(**dict(self.args, diff_against=baseline,
+                                 output_format="dict"))
+        if any(diff.values()):
+            for (section, values) in diff["added"].items():
+                self.sections[section].update(values)
+            for (section, values) in diff["changed"].items():
+                for key, (_, new) in values.items():
+                    self.sections[section][key] = new
+            for (section, values) in diff["removed"].items():
+                for key in values:
+                    del self.sections[section][key]
+            print(_format_diff(diff, "the last watermark"))
+
+    def format(self):
+        if self.args['output_format'] == 'json':
+            import json
+            return json.dumps(self.sections, default=str)
+        return _generate_formatted_text(list(self.sections.values()))
+
+
 @magics_class
 class WaterMark(Magics):
     """
     IPython magic function to print date/time stamps
     and various system information.
     """
+    def __init__(self, shell=None, **kwargs):
+        super().__init__(shell=shell, **kwargs)
+        # Remembers resolved namespace entries between --iversions calls
+        self.import_tracker = ImportTracker()
+        self.watcher = None
+
     @magic_arguments()
-    @argument('-a', '--author', type=str,
-              help='prints author name')
-    @argument('-gu', '--github_username', type=str,
-              help='prints author github username')
-    @argument('-e', '--email', type=str,
-              help='prints author email')
-    @argument('-ws', '--website', type=str,
-              help='prints author or project website')
-    @argument('-d', '--date', action='store_true',
-              help='prints current date as YYYY-mm-dd')
-    @argument('-n', '--datename', action='store_true',
-              help='prints date with abbrv. day and month names')
-    @argument('-t', '--time', action='store_true',
-              help='prints current time as HH-MM-SS')
-    @argument('-i', '--iso8601', action='store_true',
-              help='prints the combined date and time including the time zone'
-                   ' in the ISO 8601 standard with UTC offset')
-    @argument('-z', '--timezone', action='store_true',
-              help='appends the local time zone')
-    @argument('-u', '--updated', action='store_true',
-              help='appends a string "Last updated: "')
-    @argument('-c', '--custom_time', type=str,
-              help='prints a valid strftime() string')
-    @argument('-v', '--python', action='store_true',
-              help='prints Python and IPython version')
-    @argument('-p', '--packages', type=str,
-              help='prints versions of specified Python modules and packages')
-    @argument('-co', '--conda', action='store_true',
-              help='prints name of current conda environment')
-    @argument('-h', '--hostname', action='store_true',
-              help='prints the host name')
-    @argument('-m', '--machine', action='store_true',
-              help='prints system and machine info')
-    @argument('-g', '--githash', action='store_true',
-              help='prints current Git commit hash')
-    @argument('-r', '--gitrepo', action='store_true',
-              help='prints current Git remote address')
-    @argument('-b', '--gitbranch', action='store_true',
-              help='prints current Git branch')
-    @argument('-w', '--watermark', action='store_true',
-              help='prints the current version of watermark')
-    @argument('-iv', '--iversions', action='store_true',
-              help='prints the name/version of all imported modules')
-    @argument('--gpu', action='store_true',
-              help='prints GPU information (currently limited to NVIDIA GPUs),'
-                   ' if available')
-    @argument('-je', '--jupyter_env', action='store_true',
-              help='prints the current Jupyter environment (e.g., Colab, VS Code)')
-    @argument('--python_installation', action='store_true',
-              help='include information about how Python was installed')
-    @argument('--check_latest', action='store_true',
-          help='check if the latest packages are installed')
+    @_arguments
     @line_magic
     def watermark(self, line):
         """
         IPython magic function to print date/time stamps
         and various system information.
         """
-        args = vars(parse_argstring(self.watermark, line))
-
-        # renaming not to pollute the namespace
-        # while preserving backward compatibility
-        args['current_date'] = args.pop('date')
-        args['current_time'] = args.pop('time')
+        args = to_watermark_kwargs(vars(parse_argstring(self.watermark,
+                                                        line)))
         args['watermark_self'] = self
+        watch, unwatch = args.pop('watch'), args.pop('unwatch')
+        if watch or unwatch:
+            self._unwatch()
+        if unwatch:
+            return
+        if watch:
+            args['diff_against'] = None
+            self.watcher = _Watcher(args)
+            self.shell.events.register('post_run_cell', self.watcher)
+            print(self.watcher.format())
+            return
 
-        formatted_text = watermark.watermark(**args)
+        formatted_text = _watermark(**args)
         print(formatted_text)
 
+    def _unwatch(self):
+        if self.watcher is not None:
+            self.shell.events.unregister('post_run_cell', self.watcher)
+            self.watcher = None
+
 
 def load_ipython_extension(ipython):
     ipython.register_magics(WaterMark)
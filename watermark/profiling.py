@@ -0,0 +1,157 @@
+# -*- coding: utf-8 -*-
+"""
+Opt-in latency instrumentation of the watermark collectors.
+
+Each profiled collector records its wall time together with the
+subprocesses it spawned and the network connections it opened. The
+latter are observed by wrapping `subprocess.Popen` and
+`socket.socket.connect` while at least one profiled collector runs;
+the wrappers only record calls made in the context (thread or asyncio
+task) of a profiled collector and are removed again when the last one
+finishes, so nothing stays installed after a profiled call.
+
+License: BSD 3 clause
+"""
+
+import contextvars
+import threading
+import time
+
+
+_current_record = contextvars.ContextVar("watermark_record", default=None)
+_patch_lock = threading.Lock()
+_active = 0
+_restore = []
+_MISSING = object()
+
+
+def _record_subprocess(command):
+    record = _current_record.get()
+    if record is not None:
+        if not isinstance(command, (str, bytes)):
+            command = " ".join(str(arg) for arg in command)
+        record["subprocesses"].append(str(command))
+
+
+def _record_connection(address):
+    record = _current_record.get()
+    if record is not None:
+        if isinstance(address, tuple) and len(address) >= 2:
+            address = f"{address[0]}:{address[1]}"
+        record["connections"].append(str(address))
+
+
+def _patch(cls, name, wrapper):
+    original = cls.__dict__.get(name, _MISSING)
+    setattr(cls, name, wrapper(getattr(cls, name)))
+    if original is _MISSING:
+        _restore.append(lambda: delattr(cls, name))
+    else:
+        _restore.append(lambda: setattr(cls, name, original))
+
+
+def _start_observing():
+    global _active
+    with _patch_lock:
+        _active += 1
+        if _active > 1:
+            return
+        import socket
+        import subprocess
+
+        def popen_init(init):
+            def __init__(self, *args, **kwargs):
+                _record_subprocess(args[0] if args else kwargs.get("args"))
+                init(self, *args, **kwargs)
+            return __init__
+
+        def socket_connect(connect):
+            def connect_(self, address):
+                _record_connection(address)
+                return connect(self, address)
+            return connect_
+
+        _patch(subprocess.Popen, "__init__", popen_init)
+        _patch(socket.socket, "connect", socket_connect)
+
+
+def _stop_observing():
+    global _active
+    with _patch_lock:
+        _active -= 1
+        if _active == 0:
+            while _restore:
+                _restore.pop()()
+
+
+def new_record(section):
+    return {"section": section, "seconds": 0.0,
+            "subprocesses": [], "connections": []}
+
+
+def timed(record, collector):
+    """Wrap `collector` so that its run is recorded in `record`."""
+    def run(*args):
+        _start_observing()
+        token = _current_record.set(record)
+        start = time.perf_counter()
+        try:
+            return collector(*args)
+        finally:
+            record["seconds"] += time.perf_counter() - start
+            _current_record.reset(token)
+            _stop_observing()
+    return run
+
+
+def atimed(record, collector):
+    """Like `timed()`, for coroutine functions."""
+    async def run(*args):
+        _start_observing()
+        token = _current_record.set(record)
+        start = time.perf_counter()
+        try:
+            return await collector(*args)
+        finally:
+            record["seconds"] += time.perf_counter() - start
+            _current_record.reset(token)
+            _stop_observing()
+    return run
+
+
+def propagate(func):
+    """Attribute the activity of `func` to the caller's record when it
+    is run in a worker thread (e.g., by a thread pool)."""
+    if _current_record.get() is None:
+        return func
+    context = contextvars.copy_context()
+
+    def run(*args):
+        return context.copy().run(func, *args)
+    return run
+
+
+def format_record(record):
+    """Return a one-line summary such as `12.3 ms, 1 subprocess`."""
+    parts = [f"{record['seconds'] * 1000:.1f} ms"]
+    for key, singular in (("subprocesses", "subprocess"),
+                          ("connections", "connection")):
+        count = len(record[key])
+        if count:
+            parts.append(f"{count} {singular if count == 1 else key}")
+    return ", ".join(parts)
+
+
+def report(records, profile):
+    """Hand `records` to `profile`: a logger (logged at INFO level) or
+    any other callable. Returns the inline section for `profile=True`."""
+    if profile is True:
+        return {f"Profile {record['section']}": format_record(record)
+                for record in records}
+    if hasattr(profile, "info") and hasattr(profile, "isEnabledFor"):
+        for record in records:
+            profile.info("watermark %s: %s", record["section"],
+                         format_record(record))
+    else:
+        profile(records)
+    return None
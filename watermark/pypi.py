@@ -0,0 +1,345 @@
+# -*- coding: utf-8 -*-
+"""
+Batched lookup of the latest released package versions.
+
+All names are resolved concurrently over a pool of keep-alive HTTP
+connections to the index's JSON API, and results are kept in an
+on-disk cache so that repeated calls within `cache_ttl` seconds do not
+touch the network.
+
+License: BSD 3 clause
+"""
+
+import http.client
+import json
+import os
+import queue
+import ssl
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+
+from . import cache
+from . import profiling
+from .distributions import normalize_name
+
+
+DEFAULT_INDEX_URL = "https://pypi.org/pypi"
+DEFAULT_CACHE_TTL = 3600
+_CACHE_FILE = "pypi-latest.json"
+_MAX_WORKERS = 8
+_MAX_REDIRECTS = 3
+
+_cache_lock = threading.Lock()
+
+
+def get_latest_versions(names, index_url=None, timeout=2,
+                        cache_ttl=DEFAULT_CACHE_TTL, max_workers=None):
+    """Return a dict mapping each name in `names` to its latest version
+    on the package index, or None if it could not be determined.
+
+    `index_url` points to a JSON API compatible with PyPI's
+    (`<index_url>/<name>/json`); it defaults to the
+    `WATERMARK_INDEX_URL` environment variable or PyPI. Set `cache_ttl`
+    to 0 to bypass the on-disk cache.
+    """
+    index_url, now, results, missing = _lookup_cache(names, index_url,
+                                                     cache_ttl)
+    if missing:
+        fetched = _fetch_all(index_url, missing, timeout,
+                             max_workers or _MAX_WORKERS)
+        _merge(results, index_url, fetched, now, cache_ttl)
+    return {name: results[name] for name in names}
+
+
+async def aget_latest_versions(names, index_url=None, timeout=2,
+                               cache_ttl=DEFAULT_CACHE_TTL, max_workers=None):
+    """Coroutine version of `get_latest_versions()` that uses asyncio
+    streams instead of blocking sockets."""
+    import asyncio
+
+    index_url, now, results, missing = _lookup_cache(names, index_url,
+                                                     cache_ttl)
+    if missing:
+        pool = _AsyncConnectionPool(index_url, timeout)
+        slots = asyncio.Semaphore(max_workers or _MAX_WORKERS)
+
+        async def fetch(name):
+            async with slots:
+                return await pool.fetch(name)
+        try:
+            versions = await asyncio.gather(*map(fetch, missing))
+        finally:
+            pool.close()
+        _merge(results, index_url, dict(zip(missing, versions)), now,
+               cache_ttl)
+    return {name: results[name] for name in names}
+
+
+def _lookup_cache(names, index_url, cache_ttl):
+    """Return the resolved index URL, the current time, the cached
+    versions and the names that still need to be fetched."""
+    index_url = (index_url or os.environ.get("WATERMARK_INDEX_URL")
+                 or DEFAULT_INDEX_URL).rstrip("/")
+    now = time.time()
+    cached = (cache.load_json(_CACHE_FILE) or {}) if cache_ttl else {}
+
+    results = {}
+    missing = []
+    for name in names:
+        entry = cached.get(f"{index_url} {normalize_name(name)}")
+        if entry is not None and now - entry[0] < cache_ttl:
+            results[name] = entry[1]
+        elif name not in missing:
+            missing.append(name)
+    return index_url, now, results, missing
+
+
+def _merge(results, index_url, fetched, now, cache_ttl):
+    results.update(
+        (name, version) for name, (version, _) in fetched.items())
+    if cache_ttl:
+        _store(index_url, fetched, now, cache_ttl)
+
+
+def _store(index_url, fetched, now, cache_ttl):
+    with _cache_lock:
+        cached = cache.load_json(_CACHE_FILE) or {}
+        cached = {key: entry for key, entry in cached.items()
+                  if now - entry[0] < cache_ttl}
+        for name, (version, cacheable) in fetched.items():
+            if cacheable:
+                cached[f"{index_url} {normalize_name(name)}"] = [now, version]
+        cache.dump_json(_CACHE_FILE, cached)
+
+
+def _fetch_all(index_url, names, timeout, max_workers):
+    """Return {name: (version, cacheable)}; network errors are not
+    cacheable, a missing project is."""
+    pool = _ConnectionPool(index_url, timeout)
+    try:
+        if len(names) == 1 or max_workers <= 1:
+            return {name: pool.fetch(name) for name in names}
+        from concurrent.futures import ThreadPoolExecutor
+        workers = min(max_workers, len(names))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            fetch = profiling.propagate(pool.fetch)
+            return dict(zip(names, executor.map(fetch, names)))
+    finally:
+        pool.close()
+
+
+class _ConnectionPool:
+    """Keep-alive connections to a single index host, shared by threads."""
+
+    def __init__(self, index_url, timeout):
+        parts = urllib.parse.urlsplit(index_url)
+        self.index_url = index_url
+        self.scheme = parts.scheme
+        self.host = parts.hostname
+        self.port = parts.port
+        self.path = parts.path
+        self.timeout = timeout
+        # http.client does not honor proxy settings, so fall back to
+        # urllib when a proxy applies to the index.
+        self.use_urllib = bool(urllib.request.getproxies().get(self.scheme)) \
+            and not urllib.request.proxy_bypass(parts.netloc)
+        self._idle = queue.LifoQueue()
+        self._connections = []
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        if self.scheme == "https":
+            connection = http.client.HTTPSConnection(
+                self.host, self.port, timeout=self.timeout,
+                context=ssl.create_default_context())
+        else:
+            connection = http.client.HTTPConnection(
+                self.host, self.port, timeout=self.timeout)
+        with self._lock:
+            self._connections.append(connection)
+        return connection
+
+    def fetch(self, name):
+        project = f"/{urllib.parse.quote(normalize_name(name))}/json"
+        try:
+            if self.use_urllib:
+                return self._fetch_urllib(self.index_url + project)
+            return self._fetch(self.path + project)
+        except Exception:
+            return None, False
+
+    def _fetch_urllib(self, url):
+        try:
+            with urllib.request.urlopen(url, timeout=self.timeout) as response:
+                return _parse(response.read()), True
+        except urllib.error.HTTPError as e:
+            return None, e.code == 404
+
+    def _request(self, path):
+        try:
+            connection, reused = self._idle.get_nowait(), True
+        except queue.Empty:
+            connection, reused = self._connect(), False
+        try:
+            connection.request("GET", path,
+                               headers={"Accept": "application/json"})
+            response = connection.getresponse()
+            body = response.read()
+        except (http.client.HTTPException, OSError):
+            connection.close()
+            if reused:
+                # The server may have dropped an idle keep-alive connection
+                return self._request(path)
+            raise
+        if response.will_close:
+            connection.close()
+        else:
+            self._idle.put(connection)
+        return response, body
+
+    def _fetch(self, path):
+        for _ in range(_MAX_REDIRECTS + 1):
+            response, body = self._request(path)
+            if response.status in (301, 302, 307, 308):
+                location = urllib.parse.urljoin(
+                    f"{self.scheme}://{self.host}{path}",
+                    response.getheader("Location", ""))
+                parts = urllib.parse.urlsplit(location)
+                if parts.hostname != self.host:
+                    return self._fetch_urllib(location)
+                path = parts.path
+                continue
+            if response.status == 200:
+                return _parse(body), True
+            return None, response.status == 404
+        return None, False
+
+    def close(self):
+        with self._lock:
+            for connection in self._connections:
+                connection.close()
+
+
+class _AsyncConnectionPool:
+    """asyncio counterpart of `_ConnectionPool` with a minimal HTTP/1.1
+    client (keep-alive, Content-Length and chunked bodies)."""
+
+    def __init__(self, index_url, timeout):
+        self._sync = _ConnectionPool(index_url, timeout)
+        self.timeout = timeout
+        self._idle = []
+        self._writers = []
+
+    async def fetch(self, name):
+        import asyncio
+
+        sync = self._sync
+        if sync.use_urllib:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(None, sync.fetch, name)
+        path = f"{sync.path}/{urllib.parse.quote(normalize_name(name))}/json"
+        try:
+            return await asyncio.wait_for(self._fetch(path), self.timeout)
+        except Exception:
+            return None, False
+
+    async def _fetch(self, path):
+        import asyncio
+
+        sync = self._sync
+        for _ in range(_MAX_REDIRECTS + 1):
+            status, headers, body = await self._request(path)
+            if status in (301, 302, 307, 308):
+                location = urllib.parse.urljoin(
+                    f"{sync.scheme}://{sync.host}{path}",
+                    headers.get("location", ""))
+                parts = urllib.parse.urlsplit(location)
+                if parts.hostname != sync.host:
+                    loop = asyncio.get_running_loop()
+                    return await loop.run_in_executor(
+                        None, sync._fetch_urllib, location)
+                path = parts.path
+                continue
+            if status == 200:
+                return _parse(body), True
+            return None, status == 404
+        return None, False
+
+    async def _request(self, path):
+        import asyncio
+
+        sync = self._sync
+        if self._idle:
+            reader, writer = self._idle.pop()
+            reused = True
+        else:
+            port = sync.port or (443 if sync.scheme == "https" else 80)
+            reader, writer = await asyncio.open_connection(
+                sync.host, port,
+                ssl=ssl.create_default_context()
+                if sync.scheme == "https" else None)
+            self._writers.append(writer)
+            reused = False
+        host = sync.host if sync.port is None else f"{sync.host}:{sync.port}"
+        try:
+            writer.write(
+                f"GET {path} HTTP/1.1\r\nHost: {host}\r\n"
+                "Accept: application/json\r\n\r\n".encode("ascii"))
+            await writer.drain()
+            status, headers, body = await _read_response(reader)
+        except (OSError, EOFError, ValueError):
+            writer.close()
+            if reused:
+                # The server may have dropped an idle keep-alive connection
+                return await self._request(path)
+            raise
+        if headers.get("connection", "").lower() == "close":
+            writer.close()
+        else:
+            self._idle.append((reader, writer))
+        return status, headers, body
+
+    def close(self):
+        for writer in self._writers:
+            writer.close()
+
+
+async def _read_response(reader):
+    status_line = await reader.readline()
+    if not status_line:
+        raise EOFError("connection closed")
+    status = int(status_line.split()[1])
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b"\n", b""):
+            break
+        key, _, value = line.decode("latin-1").partition(":")
+        headers[key.strip().lower()] = value.strip()
+
+    if headers.get("transfer-encoding", "").lower() == "chunked":
+        chunks = []
+        while True:
+            size = int((await reader.readline()).split(b";")[0], 16)
+            if size == 0:
+                # Skip trailers up to the terminating empty line
+                while (await reader.readline()) not in (b"\r\n", b"\n",
+                                                        b""):
+                    pass
+                break
+            chunks.append(await reader.readexactly(size))
+            await reader.readline()
+        body = b"".join(chunks)
+    elif "content-length" in headers:
+        body = await reader.readexactly(int(headers["content-length"]))
+    else:
+        body = await reader.read()
+        headers["connection"] = "close"
+    return status, headers, body
+
+
+def _parse(body):
+    return json.loads(body.decode("utf-8"))["info"]["version"]
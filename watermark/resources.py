@@ -0,0 +1,157 @@
+# -*- coding: utf-8 -*-
+"""
+Runtime resources of the current process, read from `/proc` and the
+cgroup file system.
+
+Everything is read in one pass over a handful of small files, without
+psutil or subprocesses: memory and thread count from
+`/proc/self/status`, open file descriptors from `/proc/self/fd`, the
+load average from `/proc/loadavg`, CPU model and frequency from
+`/proc/cpuinfo`, and the CPU and memory limits of the process' cgroup
+(v2 or v1). The limits matter in containers, where `os.cpu_count()`
+reports the CPUs of the host.
+
+License: BSD 3 clause
+"""
+
+import os
+
+
+# cgroup v1 reports "no memory limit" as a huge page-aligned number
+_V1_UNLIMITED = 2**60
+
+
+def read(proc="/proc", cgroup_root="/sys/fs/cgroup"):
+    """Return the runtime resources of the current process as a dict, or
+    None if `proc` is not available (e.g., on macOS or Windows).
+
+    The dict has `rss` and `peak_rss` (bytes), `threads`, `open_fds`,
+    `cpu_limit` (CPUs) and `memory_limit` (bytes), which are None when
+    unlimited, `loadavg` (1, 5, 15 minutes), `cpu_model` and `cpu_mhz`
+    (mean over all CPUs); values that cannot be read are None.
+    """
+    status = _read(os.path.join(proc, "self", "status"))
+    if status is None:
+        return None
+    fields = dict(line.split(":", 1) for line in status.splitlines()
+                  if ":" in line)
+    try:
+        # The directory descriptor opened by listdir() itself is listed
+        open_fds = len(os.listdir(os.path.join(proc, "self", "fd"))) - 1
+    except OSError:
+        open_fds = None
+    loadavg = _read(os.path.join(proc, "loadavg"))
+    cpu_model, cpu_mhz = _cpuinfo(_read(os.path.join(proc, "cpuinfo")))
+    cpu_limit, memory_limit = _cgroup_limits(
+        _read(os.path.join(proc, "self", "cgroup")), cgroup_root)
+    return {
+        "rss": _kib(fields.get("VmRSS")),
+        "peak_rss": _kib(fields.get("VmHWM")),
+        "threads": _int(fields.get("Threads")),
+        "open_fds": open_fds,
+        "cpu_limit": cpu_limit,
+        "memory_limit": memory_limit,
+        "loadavg": tuple(float(value) for value in loadavg.split()[:3])
+        if loadavg else None,
+        "cpu_model": cpu_model,
+        "cpu_mhz": cpu_mhz,
+    }
+
+
+def _read(path):
+    try:
+        with open(path, encoding="utf-8", errors="replace") as f:
+            return f.read()
+    except OSError:
+        return None
+
+
+def _int(value):
+    try:
+        return int(value.split()[0])
+    except (AttributeError, IndexError, ValueError):
+        return None
+
+
+def _kib(value):
+    # e.g., "  123456 kB"
+    value = _int(value)
+    return None if value is None else value * 1024
+
+
+def _cpuinfo(text):
+    model, mhz = None, []
+    for line in (text or "").splitlines():
+        key, _, value = line.partition(":")
+        key = key.strip()
+        if key == "model name" and model is None:
+            model = value.strip()
+        elif key == "cpu MHz":
+            try:
+                mhz.append(float(value))
+            except ValueError:
+                pass
+    return model, round(sum(mhz) / len(mhz), 1) if mhz else None
+
+
+def _cgroup_limits(text, root):
+    """Return the `(CPU limit, memory limit)` of the cgroups listed in
+    `/proc/self/cgroup`; the tightest limit of each cgroup and its
+    ancestors applies."""
+    v1, v2 = {}, None
+    for line in (text or "").splitlines():
+        parts = line.split(":", 2)
+        if len(parts) != 3:
+            continue
+        if parts[0] == "0" and not parts[1]:
+            v2 = parts[2]
+        for controller in parts[1].split(","):
+            v1[controller] = (parts[1], parts[2])
+
+    cpu_limit = memory_limit = None
+    if "cpu" in v1:
+        mount, path = v1["cpu"]
+        for directory in _ancestors(os.path.join(root, mount), path):
+            quota = _int(_read(os.path.join(directory, "cpu.cfs_quota_us")))
+            period = _int(_read(os.path.join(directory,
+                                             "cpu.cfs_period_us")))
+            if quota and quota > 0 and period:
+                cpu_limit = _min(cpu_limit, quota / period)
+    if "memory" in v1:
+        mount, path = v1["memory"]
+        for directory in _ancestors(os.path.join(root, mount), path):
+            limit = _int(_read(os.path.join(directory,
+                                            "memory.limit_in_bytes")))
+            if limit and limit < _V1_UNLIMITED:
+                memory_limit = _min(memory_limit, limit)
+    if v2 is not None:
+        for directory in _ancestors(root, v2):
+            if "cpu" not in v1:
+                cpu_max = (_read(os.path.join(directory, "cpu.max"))
+                           or "").split()
+                if len(cpu_max) == 2 and cpu_max[0] != "max":
+                    cpu_limit = _min(cpu_limit,
+                                     int(cpu_max[0]) / int(cpu_max[1]))
+            if "memory" not in v1:
+                limit = _int(_read(os.path.join(directory, "memory.max")))
+                if limit is not None:
+                    memory_limit = _min(memory_limit, limit)
+    return cpu_limit, memory_limit
+
+
+def _ancestors(mount, path):
+    """Yield the existing directories of the cgroup `path` and its
+    ancestors below `mount`.
+
+    In a container with its own cgroup namespace the path refers to the
+    host's hierarchy and only the mount itself exists.
+    """
+    parts = [part for part in path.split("/") if part and part != ".."]
+    for i in range(len(parts), -1, -1):
+        directory = os.path.join(mount, *parts[:i])
+        if os.path.isdir(directory):
+            yield directory
+
+
+def _min(current, value):
+    return value if current is None else min(current, value)
@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+"""
+Snapshot of all installed distributions.
+
+The `*.dist-info` and `*.egg-info` entries of the `sys.path` directories
+are scanned directly and only the `Name` and `Version` headers of their
+metadata are read, which is much cheaper than enumerating distributions
+through `importlib.metadata` on large environments. Results are
+streamed one distribution at a time, as JSON Lines or as a
+requirements-style lockfile.
+
+License: BSD 3 clause
+"""
+
+import json
+import os
+import sys
+
+from .distributions import _parse_headers, normalize_name
+
+
+FORMATS = ("jsonl", "requirements")
+
+
+def iter_distributions(paths=None):
+    """Yield `(name, version, directory)` of the distributions installed
+    in `paths` (default: `sys.path`).
+
+    As with imports, the first distribution of a name on the path wins.
+    """
+    seen = set()
+    for path in sys.path if paths is None else paths:
+        try:
+            entries = sorted(os.listdir(path or "."))
+        except OSError:
+            continue
+        for entry in entries:
+            stem, ext = os.path.splitext(entry)
+            if ext not in (".dist-info", ".egg-info"):
+                continue
+            name, version = _read_headers(os.path.join(path, entry), ext)
+            if not name:
+                continue
+            normalized = normalize_name(name)
+            if normalized in seen:
+                continue
+            seen.add(normalized)
+            yield name, version, path
+
+
+def _read_headers(path, ext):
+    # A *.egg-info entry is either a directory or the PKG-INFO file itself
+    if ext == ".dist-info":
+        candidates = [os.path.join(path, "METADATA")]
+    else:
+        candidates = [os.path.join(path, "PKG-INFO"), path]
+    for candidate in candidates:
+        try:
+            with open(candidate, encoding="utf-8", errors="replace") as f:
+                return _parse_headers(f)
+        except OSError:
+            continue
+    return None, None
+
+
+def write_snapshot(file=None, format="jsonl", paths=None):
+    """Write all installed distributions to `file` and return their
+    number.
+
+    Parameters
+    ----------
+    file : str or file object (default: None)
+        Path or text file to write to; `sys.stdout` by default.
+
+    format : str (default: "jsonl")
+        `"jsonl"` writes one `{"name", "version", "location"}` JSON
+        object per line, `"requirements"` one `name==version` line.
+
+    paths : list of str (default: None)
+        Directories to scan instead of `sys.path`.
+    """
+    if format not in FORMATS:
+        raise ValueError(
+            f"format must be 'jsonl' or 'requirements', not {format!r}")
+    if file is None:
+        return _write(sys.stdout, format, paths)
+    if isinstance(file, (str, os.PathLike)):
+        with open(file, "w", encoding="utf-8") as f:
+            return _write(f, format, paths)
+    return _write(file, format, paths)
+
+
+def _write(f, format, paths):
+    count = 0
+    for name, version, location in iter_distributions(paths):
+        if format == "jsonl":
+            f.write(json.dumps({"name": name, "version": version,
+                                "location": location}) + "\n")
+        else:
+            f.write(f"{name}=={version}\n")
+        count += 1
+    return count
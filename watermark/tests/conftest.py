@@ -0,0 +1,10 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+
+@pytest.fixture(autouse=True)
+def cache_dir(tmp_path, monkeypatch):
+    """Keep the on-disk caches of the tests out of ~/.cache/watermark."""
+    path = tmp_path / "watermark-cache"
+    monkeypatch.setenv("WATERMARK_CACHE_DIR", str(path))
+    return path
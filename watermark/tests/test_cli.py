@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+from watermark import cli
+
+
+def test_flags_match_watermark(capsys):
+    assert cli.main(["-v", "-h", "--output_format", "json"]) == 0
+    sections = json.loads(capsys.readouterr().out)
+    assert list(sections) == ["python", "hostname"]
+
+    import watermark
+    cli.main(["-p", "pytest", "-d"])
+    assert capsys.readouterr().out == watermark.watermark(
+        packages="pytest", current_date=True) + "\n"
+
+
+def test_iversions_is_magic_only(capsys):
+    with pytest.raises(SystemExit):
+        cli.main(["--iversions"])
+    assert "unrecognized arguments" in capsys.readouterr().err
+
+
+def test_module_does_not_import_ipython():
+    env = dict(os.environ, WATERMARK_NO_CACHE="1")
+    out = subprocess.run(
+        [sys.executable, "-X", "importtime", "-m", "watermark", "-v"],
+        env=env, check=True, capture_output=True, text=True)
+    assert "IPython version" in out.stdout
+    assert "IPython" not in out.stderr
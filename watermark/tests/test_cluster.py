@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+import json
+
+from watermark import cluster
+
+
+def test_aggregate_groups_mismatched_workers(monkeypatch):
+    envs = ["base", "base", "old", "base"]
+    replies = []
+
+    def transport(func, *args):
+        for i, env in enumerate(envs):
+            monkeypatch.setenv("CONDA_DEFAULT_ENV", env)
+            monkeypatch.setattr(cluster, "worker_id", lambda: f"node:{i}")
+            replies.append(func(*args))
+        return replies
+
+    monkeypatch.setenv("CONDA_DEFAULT_ENV", "base")
+    report = cluster.aggregate(transport, output_format="dict", conda=True,
+                               python=True, packages="pytest")
+
+    # Workers that agree with the coordinator only send digests
+    assert [reply["sections"] for reply in replies] == [
+        {}, {}, {"conda": {"conda environment": "old"}}, {}]
+    assert report["workers"] == 4
+    common, other = report["groups"]
+    assert common["workers"] == ["node:0", "node:1", "node:3"]
+    assert common["sections"]["conda"] == {"conda environment": "base"}
+    assert "pytest" in common["sections"]["packages"]
+    assert other == {
+        "workers": ["node:2"],
+        "differences": {
+            "added": {}, "removed": {},
+            "changed": {"conda": {"conda environment": ["base", "old"]}},
+        },
+    }
+
+    monkeypatch.setenv("CONDA_DEFAULT_ENV", "base")
+    replies.clear()
+    text = cluster.aggregate(transport, conda=True)
+    assert text.splitlines() == [
+        "Workers: 4 in 2 groups",
+        "",
+        "Group 1: 3 workers (node:0, node:1, node:3)",
+        "conda environment: base",
+        "",
+        "Group 2: 1 worker (node:2)",
+        "~ conda / conda environment: base -> old",
+    ]
+
+
+def test_aggregate_process_pool():
+    report = json.loads(cluster.aggregate(
+        cluster.ExecutorTransport(n_workers=2), output_format="json",
+        python=True, machine=True))
+    assert 1 <= report["workers"] <= 2
+    assert all(worker != cluster.worker_id()
+               for group in report["groups"] for worker in group["workers"])
+    # Worker processes of one machine share the same environment
+    assert len(report["groups"]) == 1
+    assert set(report["groups"][0]["sections"]) == {"python", "machine"}
@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+import json
+
+import pytest
+
+import watermark
+from watermark import conda
+
+
+@pytest.fixture
+def env(tmp_path, monkeypatch):
+    prefix = tmp_path / "env"
+    meta = prefix / "conda-meta"
+    meta.mkdir(parents=True)
+    monkeypatch.setenv("CONDA_PREFIX", str(prefix))
+    monkeypatch.setenv("WATERMARK_CACHE_DIR", str(tmp_path / "cache"))
+    monkeypatch.setattr(conda, "_index", None)
+
+    def install(name, version, build, channel, **extra):
+        record = dict(name=name, version=version, build=build,
+                      channel=channel, files=["a"] * 1000, **extra)
+        (meta / f"{name}-{version}-{build}.json").write_text(
+            json.dumps(record))
+    install.meta = meta
+    return install
+
+
+def test_conda_packages(env, monkeypatch):
+    env("libfoo", "1.2.3", "h1234_0",
+        "https://conda.anaconda.org/conda-forge/linux-64")
+    env("pytest", "0.0.1", "py_0",
+        "https://repo.anaconda.com/pkgs/main/noarch", schannel="pkgs/main")
+    (env.meta / "history").write_text("")
+
+    sections = watermark.watermark(packages="libfoo,pytest",
+                                   output_format="dict")
+    # Distribution metadata takes precedence over conda-meta
+    assert sections["packages"] == {"libfoo": "1.2.3",
+                                    "pytest": pytest.__version__}
+
+    sections = watermark.watermark(packages="libfoo,pytest", conda=True,
+                                   output_format="dict")
+    assert sections["packages"] == {
+        "libfoo": "1.2.3 (h1234_0, conda-forge)",
+        "pytest": f"{pytest.__version__} (py_0, pkgs/main)",
+    }
+
+    # Unchanged environments are served from the index; on changes only
+    # new files are read
+    read = []
+    original = conda._read_channel
+    monkeypatch.setattr(conda, "_read_channel",
+                        lambda path: read.append(path) or original(path))
+    monkeypatch.setattr(conda, "_index", None)
+    conda.get_index()
+    assert read == []
+    env("libbar", "2.0", "0", "defaults")
+    assert conda.get_index().lookup("libbar")["channel"] == "defaults"
+    assert [p.endswith("libbar-2.0-0.json") for p in read] == [True]
+
+
+def test_channel_names():
+    assert conda._channel_name(
+        "https://conda.anaconda.org/conda-forge/osx-arm64") == "conda-forge"
+    assert conda._channel_name(
+        "https://conda.anaconda.org/conda-forge") == "conda-forge"
+    assert conda._channel_name(
+        "https://example.com/channel/noarch") == "example.com/channel"
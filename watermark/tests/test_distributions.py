@@ -0,0 +1,160 @@
+# -*- coding: utf-8 -*-
+import sys
+
+import pytest
+
+from watermark import distributions
+
+
+def _make_dist(site, name, version, top_level=None, record=None):
+    dist_info = site / f"{name.replace('-', '_')}-{version}.dist-info"
+    dist_info.mkdir()
+    (dist_info / "METADATA").write_text(
+        f"Metadata-Version: 2.1\nName: {name}\nVersion: {version}\n\n"
+        "Name: not-a-header\n")
+    if top_level is not None:
+        (dist_info / "top_level.txt").write_text(top_level)
+    if record is not None:
+        (dist_info / "RECORD").write_text(record)
+
+
+def test_lookup_by_name_and_module(tmp_path):
+    _make_dist(tmp_path, "Scikit-Learn", "1.2.3", top_level="sklearn\n")
+    _make_dist(tmp_path, "flit-built", "0.1",
+               record="flit_mod/__init__.py,,\n")
+    _make_dist(tmp_path, "ns-a", "1.0", top_level="shared\n")
+    _make_dist(tmp_path, "ns-b", "2.0", top_level="shared\n")
+
+    index = distributions.DistributionIndex([str(tmp_path)])
+    assert index.lookup("scikit_learn") == ("Scikit-Learn", "1.2.3")
+    assert index.lookup("sklearn") == ("Scikit-Learn", "1.2.3")
+    assert index.version("flit_mod") == "0.1"
+    assert index.version("shared") is None
+    assert index.version("missing") is None
+
+
+def test_concurrent_lookups_during_record_scan(tmp_path):
+    import threading
+    import time
+
+    for i in range(20):
+        _make_dist(tmp_path, f"flit-{i}", "0.1",
+                   record=f"flit_mod_{i}/__init__.py,,\n")
+    index = distributions.DistributionIndex([str(tmp_path)])
+    add_module = index._add_module
+
+    def slow_add_module(*args):
+        time.sleep(0.001)
+        add_module(*args)
+
+    index._add_module = slow_add_module
+    barrier = threading.Barrier(8)
+    results = []
+
+    def lookup():
+        barrier.wait()
+        results.append(index.version("flit_mod_19"))
+
+    threads = [threading.Thread(target=lookup) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert results == ["0.1"] * 8
+
+
+def test_index_is_rebuilt_when_site_packages_change(tmp_path, monkeypatch):
+    monkeypatch.setattr(sys, "path", [str(tmp_path)])
+    index = distributions.get_index()
+    assert distributions.get_index() is index
+    assert index.version("fresh") is None
+
+    _make_dist(tmp_path, "fresh", "3.0")
+    assert distributions.get_index().version("fresh") == "3.0"
+
+
+def test_static_version_does_not_import(tmp_path, monkeypatch):
+    pkg = tmp_path / "sideeffects"
+    pkg.mkdir()
+    (pkg / "__init__.py").write_text(
+        "raise RuntimeError('imported')\n"
+        "from ._version import version as __version__\n")
+    (pkg / "_version.py").write_text("__version__ = version = '4.5.6'\n")
+    (tmp_path / "plainmod.py").write_text("__version__: str = '0.9'\n")
+    monkeypatch.syspath_prepend(str(tmp_path))
+
+    assert distributions.find_static_version("sideeffects") == "4.5.6"
+    assert distributions.find_static_version("plainmod") == "0.9"
+    assert "sideeffects" not in sys.modules
+
+
+def test_path_digests_are_cached_by_mtime(tmp_path, monkeypatch):
+    monkeypatch.setenv("WATERMARK_CACHE_DIR", str(tmp_path / "cache"))
+    monkeypatch.setattr(distributions, "_digests", None)
+    site = tmp_path / "site"
+    site.mkdir()
+    _make_dist(site, "foo", "1.0")
+    (site, digest), = distributions.path_digests([str(site)])
+    assert digest is not None
+
+    scanned = []
+    monkeypatch.setattr(distributions, "_dist_stems",
+                        lambda path: scanned.append(path) or [])
+    # A new process only stats the directory
+    monkeypatch.setattr(distributions, "_digests", None)
+    assert distributions.path_digests([str(site)])[0][1] == digest
+    assert scanned == []
+
+
+
+def test_concurrent_path_digests(tmp_path, monkeypatch):
+    import threading
+    import time
+
+    from watermark import cache
+
+    monkeypatch.setattr(distributions, "_digests", None)
+    dump_json = cache.dump_json
+
+    def slow_dump_json(name, obj):
+        # Widen the window in which another thread could add a path
+        for _ in obj:
+            time.sleep(0.001)
+        dump_json(name, obj)
+
+    monkeypatch.setattr(cache, "dump_json", slow_dump_json)
+    errors = []
+
+    def digest(i):
+        try:
+            for j in range(5):
+                site = tmp_path / f"site{i}-{j}"
+                site.mkdir()
+                _make_dist(site, f"pkg{i}", f"1.{j}")
+                distributions.path_digests([str(site)])
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=digest, args=(i,)) for i in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert errors == []
+    assert len(distributions._digests) == 40
+
+def test_match_names():
+    names = ["torchvision", "Acme_Utils", "torch", "jaxlib", "acme-core",
+             "jax", "numpy", "Torch"]
+    assert distributions.match_names(
+        ["torch*", "acme-*", "re:jax(lib)?", "tor?h", "nomatch*"],
+        names) == {
+        "torch*": ["torch", "torchvision"],
+        "acme-*": ["acme-core", "Acme_Utils"],
+        "re:jax(lib)?": ["jax", "jaxlib"],
+        "tor?h": ["torch"],
+        "nomatch*": [],
+    }
+    assert not distributions.is_pattern("scikit-learn")
+    with pytest.raises(ValueError, match="invalid pattern"):
+        distributions.match_names(["re:("], names)
@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+import sys
+import sysconfig
+import venv
+from pathlib import Path
+
+import watermark
+
+
+def _make_venv(path, *dists):
+    venv.create(path, with_pip=False)
+    site = Path(sysconfig.get_path(
+        "purelib", vars={"base": str(path), "platbase": str(path)}))
+    for name, version, top_level in dists:
+        dist_info = site / f"{name.replace('-', '_')}-{version}.dist-info"
+        dist_info.mkdir()
+        (dist_info / "METADATA").write_text(
+            f"Metadata-Version: 2.1\nName: {name}\nVersion: {version}\n\n")
+        if top_level:
+            (dist_info / "top_level.txt").write_text(top_level)
+    return path
+
+
+def test_survey(tmp_path):
+    env_a = _make_venv(tmp_path / "a", ("Scikit-Learn", "1.2.3", "sklearn\n"))
+    env_b = _make_venv(tmp_path / "b", ("IPython", "7.0.0", None))
+    targets = [str(env_a), str(env_b), str(tmp_path / "missing")]
+    reports = watermark.survey(targets, packages="scikit_learn,sklearn",
+                               max_workers=2, output_format="dict")
+
+    assert list(reports) == targets
+    a, b, missing = reports.values()
+    assert a["packages"] == {"scikit_learn": "1.2.3", "sklearn": "1.2.3"}
+    assert a["python"]["IPython version"] == "not installed"
+    assert a["python"]["Python version"] == \
+        watermark.watermark(python=True, output_format="dict")[
+            "python"]["Python version"]
+    assert a["python_installation"]["Python installation"] == \
+        "Virtual Environment (venv/virtualenv)"
+    assert b["packages"] == {"scikit_learn": "unknown", "sklearn": "unknown"}
+    assert b["python"]["IPython version"] == "7.0.0"
+    assert missing["error"].startswith("n/a (")
+
+    table = watermark.survey([str(env_a), sys.executable], packages="sklearn")
+    header, row_a, row_self = table.splitlines()
+    assert header.split() == ["Environment", "Python", "Implementation",
+                              "IPython", "Installation", "sklearn"]
+    assert row_a.startswith(str(env_a)) and row_a.endswith("1.2.3")
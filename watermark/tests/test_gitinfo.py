@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+import os
+import shutil
+import subprocess
+
+import pytest
+
+from watermark import gitinfo
+
+
+pytestmark = pytest.mark.skipif(shutil.which("git") is None,
+                                reason="git executable not available")
+
+
+def _git(cwd, *args):
+    env = dict(os.environ, GIT_AUTHOR_NAME="a", GIT_AUTHOR_EMAIL="a@b.c",
+               GIT_COMMITTER_NAME="a", GIT_COMMITTER_EMAIL="a@b.c")
+    return subprocess.run(["git", *args], cwd=cwd, env=env, check=True,
+                          capture_output=True, text=True).stdout.strip()
+
+
+@pytest.fixture
+def repo(tmp_path):
+    path = tmp_path / "repo"
+    path.mkdir()
+    _git(path, "init", "-q", "-b", "main")
+    _git(path, "remote", "add", "origin", "https://example.com/x.git")
+    (path / "a.txt").write_text("a")
+    _git(path, "add", "a.txt")
+    _git(path, "commit", "-q", "-m", "init")
+    return path
+
+
+def test_matches_git_subprocess(repo):
+    info = gitinfo.read_git_info(repo, dirty=True)
+    assert info == gitinfo._read_git_subprocess(repo, True)
+    assert info["remote"] == "https://example.com/x.git"
+    assert info["branch"] == "main"
+    assert info["dirty"] is False
+
+
+def test_packed_refs_and_detached_head(repo):
+    _git(repo, "pack-refs", "--all")
+    assert not (repo / ".git" / "refs" / "heads" / "main").exists()
+    head = _git(repo, "rev-parse", "HEAD")
+    assert gitinfo.read_git_info(repo)["hash"] == head
+
+    _git(repo, "checkout", "-q", "--detach")
+    info = gitinfo.read_git_info(repo)
+    assert info["hash"] == head
+    assert info["branch"] == "HEAD"
+
+
+def test_find_packed_ref(tmp_path):
+    sha, tag_sha, other = "a" * 40, "b" * 40, "c" * 40
+    (tmp_path / "packed-refs").write_text(
+        "# pack-refs with: peeled fully-peeled sorted\n"
+        f"{other} refs/heads/xmain\n"
+        f"{tag_sha} refs/tags/main\n"
+        f"^{other}\n"
+        f"{sha} refs/heads/main\n"
+        f"{other} refs/heads/last")
+    find = gitinfo._find_packed_ref
+    assert find(str(tmp_path), "refs/heads/main") == sha
+    assert find(str(tmp_path), "refs/tags/main") == tag_sha
+    # The last line has no trailing newline
+    assert find(str(tmp_path), "refs/heads/last") == other
+    assert find(str(tmp_path), "refs/heads/missing") is None
+    assert find(str(tmp_path / "missing"), "refs/heads/main") is None
+
+
+def test_worktree(repo, tmp_path):
+    _git(repo, "worktree", "add", "-q", "-b", "feature",
+         str(tmp_path / "wt"))
+    info = gitinfo.read_git_info(tmp_path / "wt" / ".")
+    assert info["branch"] == "feature"
+    assert info["hash"] == _git(repo, "rev-parse", "HEAD")
+    assert info["remote"] == "https://example.com/x.git"
+
+
+def test_dirty_flag(repo):
+    (repo / "a.txt").write_text("changed")
+    assert gitinfo.read_git_info(repo, dirty=True)["dirty"] is True
+    (repo / "a.txt").unlink()
+    assert gitinfo.read_git_info(repo, dirty=True)["dirty"] is True
+
+
+def test_not_a_repository(tmp_path):
+    info = gitinfo.read_git_info(tmp_path)
+    assert info["hash"].startswith("n/a")
+
+
+@pytest.mark.skipif(os.name != "posix", reason="uses a shell script")
+def test_hung_git_is_killed(tmp_path, monkeypatch):
+    import time
+
+    fake_git = tmp_path / "git"
+    fake_git.write_text("#!/bin/sh\nsleep 30\n")
+    fake_git.chmod(0o755)
+    monkeypatch.setenv("PATH", f"{tmp_path}{os.pathsep}{os.environ['PATH']}")
+    start = time.monotonic()
+    result = gitinfo._run_git(["status"], None,
+                              deadline=time.monotonic() + 0.2)
+    assert result == "n/a (timed out)"
+    assert time.monotonic() - start < 5
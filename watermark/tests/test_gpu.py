@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+import json
+from types import SimpleNamespace
+
+import pytest
+
+import watermark
+from watermark import gpu
+
+
+class FakeNVML:
+    """Stands in for `py3nvml.py3nvml` on machines without a GPU."""
+
+    class NVMLError_LibraryNotFound(Exception):
+        pass
+
+    def __init__(self, n_devices=2):
+        self.n_devices = n_devices
+        self.calls = []
+        self.used = 2**30
+
+    def _call(self, name, result):
+        self.calls.append(name)
+        return result
+
+    def nvmlInit(self):
+        self._call("nvmlInit", None)
+
+    def nvmlShutdown(self):
+        self._call("nvmlShutdown", None)
+
+    def nvmlDeviceGetCount(self):
+        return self._call("nvmlDeviceGetCount", self.n_devices)
+
+    def nvmlDeviceGetHandleByIndex(self, i):
+        return i
+
+    def nvmlDeviceGetName(self, handle):
+        return self._call("nvmlDeviceGetName", b"Fake GPU")
+
+    def nvmlDeviceGetUUID(self, handle):
+        return f"GPU-{handle:04d}"
+
+    def nvmlDeviceGetPciInfo(self, handle):
+        return SimpleNamespace(busId=f"00000000:0{handle}:00.0")
+
+    def nvmlDeviceGetMemoryInfo(self, handle):
+        return SimpleNamespace(total=16 * 2**30, used=self.used)
+
+    def nvmlDeviceGetUtilizationRates(self, handle):
+        return SimpleNamespace(gpu=42, memory=7)
+
+    def nvmlSystemGetDriverVersion(self):
+        return "535.54.03"
+
+    def nvmlSystemGetCudaDriverVersion(self):
+        return 12020
+
+
+@pytest.fixture
+def nvml():
+    fake = FakeNVML()
+    gpu.set_backend(fake)
+    yield fake
+    gpu.set_backend(None)
+
+
+def test_session_is_reused(nvml):
+    for _ in range(3):
+        sections = watermark.watermark(gpu=True, output_format="dict")
+    assert nvml.calls.count("nvmlInit") == 1
+    # Static facts are only read once
+    assert nvml.calls.count("nvmlDeviceGetName") == 2
+
+    devices = sections["gpu"]["GPU Info"]
+    assert devices[1] == {
+        "index": 1, "name": "Fake GPU", "uuid": "GPU-0001",
+        "pci_bus_id": "00000000:01:00.0", "memory_total": 16 * 2**30,
+        "memory_used": 2**30, "utilization_gpu": 42,
+        "utilization_memory": 7,
+    }
+    assert sections["gpu"]["CUDA version"] == "12.2"
+    assert json.loads(watermark.watermark(gpu=True, output_format="json"))
+
+    nvml.used = 2**31
+    text = watermark.watermark(gpu=True)
+    assert "GPU 0: Fake GPU (2.0/16.0 GiB, 42% utilization)" in text
+    assert "NVIDIA driver: 535.54.03" in text
+
+    gpu.shutdown()
+    assert nvml.calls[-1] == "nvmlShutdown"
+    watermark.watermark(gpu=True)
+    assert nvml.calls.count("nvmlInit") == 2
+
+
+def test_missing_driver(nvml):
+    def fail():
+        raise FakeNVML.NVMLError_LibraryNotFound()
+
+    nvml.nvmlInit = fail
+    text = watermark.watermark(gpu=True)
+    assert "NVIDIA drivers do not appear to be installed" in text
+
+
+def test_diff_compares_static_facts(nvml, tmp_path):
+    baseline = watermark.watermark(gpu=True, output_format="dict")
+    path = tmp_path / "baseline.json"
+    path.write_text(json.dumps(baseline, default=str))
+
+    nvml.used = 2**31
+    assert watermark.watermark(diff_against=str(path)) == \
+        f"No changes since {path}"
+
+    other = FakeNVML()
+    other.nvmlDeviceGetName = lambda handle: b"Other GPU"
+    gpu.set_backend(other)
+    assert watermark.watermark(diff_against=str(path)).splitlines() == [
+        f"Changes since {path}:",
+        "~ gpu / GPU 0 name: Fake GPU -> Other GPU",
+        "~ gpu / GPU 1 name: Fake GPU -> Other GPU",
+    ]
+
+
+def test_cluster_groups_by_static_facts(nvml, monkeypatch):
+    from watermark import cluster
+
+    def transport(func, *args):
+        replies = []
+        for i, used in enumerate([2**30, 2**32, 0]):
+            nvml.used = used
+            monkeypatch.setattr(cluster, "worker_id", lambda: f"node:{i}")
+            replies.append(func(*args))
+        return replies
+
+    report = cluster.aggregate(transport, output_format="dict", gpu=True)
+    assert report["workers"] == 3
+    # Workers that only differ in memory usage are merged
+    (group,) = report["groups"]
+    assert group["workers"] == ["node:0", "node:1", "node:2"]
+    assert group["sections"]["gpu"]["GPU 1 uuid"] == "GPU-0001"
+    assert group["sections"]["gpu"]["NVIDIA driver"] == "535.54.03"
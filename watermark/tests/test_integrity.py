@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+import base64
+import hashlib
+
+import pytest
+
+from watermark import distributions
+from watermark import integrity
+
+
+def _record_hash(data):
+    digest = hashlib.sha256(data).digest()
+    return base64.urlsafe_b64encode(digest).rstrip(b"=").decode()
+
+
+def _make_wheel_install(site, name, files):
+    dist_info = site / f"{name}-1.0.dist-info"
+    dist_info.mkdir()
+    (dist_info / "METADATA").write_text(f"Name: {name}\nVersion: 1.0\n")
+    (dist_info / "top_level.txt").write_text(f"{name}\n")
+    record = [f"{path},sha256={_record_hash(data)},{len(data)}"
+              for path, data in files.items()]
+    record.append(f"{dist_info.name}/RECORD,,")
+    (dist_info / "RECORD").write_text("\n".join(record) + "\n")
+    for path, data in files.items():
+        (site / path).parent.mkdir(parents=True, exist_ok=True)
+        (site / path).write_bytes(data)
+
+
+@pytest.mark.parametrize("pool_threshold", [256, 1])
+def test_verify(tmp_path, monkeypatch, pool_threshold):
+    monkeypatch.setenv("WATERMARK_CACHE_DIR", str(tmp_path / "cache"))
+    monkeypatch.setattr(integrity, "_hashes", None)
+    monkeypatch.setattr(integrity, "POOL_THRESHOLD", pool_threshold)
+    site = tmp_path / "site"
+    site.mkdir()
+    _make_wheel_install(site, "intact", {"intact/__init__.py": b"x = 1\n",
+                                         "intact/empty.py": b""})
+    _make_wheel_install(site, "broken", {"broken/__init__.py": b"",
+                                         "broken/a.py": b"a = 1\n",
+                                         "broken/b.py": b"b = 1\n"})
+    (site / "broken" / "a.py").write_bytes(b"a = 2\n")
+    (site / "broken" / "b.py").unlink()
+    (site / "legacy-0.1.egg-info").mkdir()
+    (site / "legacy-0.1.egg-info" / "PKG-INFO").write_text(
+        "Name: legacy\nVersion: 0.1\n")
+    index = distributions.DistributionIndex([str(site)])
+
+    expected = {"intact": "OK", "broken": "modified: 1 file, missing: 1 file",
+                "legacy": "no RECORD"}
+    names = ["intact", "broken", "legacy", "nomatch"]
+    assert integrity.verify(names, index) == expected
+
+    # Unchanged files are not hashed again
+    monkeypatch.setattr(integrity, "_hashes", None)
+    monkeypatch.setattr(integrity, "_hash_file", None)
+    assert integrity.verify(names, index) == expected
+
+
+def test_unguarded_script(tmp_path):
+    import os
+    import subprocess
+    import sys
+
+    script = tmp_path / "job.py"
+    script.write_text(
+        "print('JOB START')\n"
+        "from watermark import integrity, watermark\n"
+        "integrity.POOL_THRESHOLD = 1\n"
+        "print(watermark(packages='pytest,pip', verify=True))\n"
+        "print('JOB END')\n")
+    root = os.path.dirname(os.path.dirname(integrity.__file__))
+    env = dict(os.environ, WATERMARK_CACHE_DIR=str(tmp_path / "cache"),
+               PYTHONPATH=root)
+    result = subprocess.run([sys.executable, str(script)], env=env,
+                            capture_output=True, text=True, timeout=60)
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.count("JOB START") == 1
+    assert "pytest:" in result.stdout and "JOB END" in result.stdout
@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+import sys
+
+import pytest
+
+pytest.importorskip("IPython")
+
+
+@pytest.fixture
+def ip():
+    from IPython.testing.globalipapp import get_ipython
+
+    shell = get_ipython()
+    shell.run_line_magic("load_ext", "watermark")
+    yield shell
+    shell.run_line_magic("watermark", "--unwatch")
+
+
+def test_watch_reports_only_changes(ip, capsys, monkeypatch):
+    magic_module = sys.modules["watermark.magic"]
+    ip.run_cell("%watermark --watch -iv -p pytest")
+    assert "pytest" in capsys.readouterr().out
+
+    calls = []
+    original = magic_module._watermark
+    monkeypatch.setattr(magic_module, "_watermark",
+                        lambda **kw: calls.append(kw) or original(**kw))
+    ip.run_cell("_unchanged = None")
+    ip.run_cell("pass")
+    # Neither input/output history nor other values trigger a collection
+    for cell in ("1 + 1", "print", "_unchanged = 2", "_"):
+        ip.run_cell(cell, store_history=True)
+    assert calls == []
+    capsys.readouterr()
+
+    ip.run_cell("def _new_function(): pass", store_history=True)
+    # Only the new name triggered a collection
+    assert len(calls) == 1
+    assert capsys.readouterr().out == ""
+
+    ip.run_cell("import pytest as _pytest_alias")
+    assert f"+ iversions / pytest: {pytest.__version__}" in \
+        capsys.readouterr().out
+
+    ip.run_cell("%watermark --unwatch")
+    ip.run_cell("import json as _json_alias")
+    assert capsys.readouterr().out == ""
+
+
+def test_watch_checks_only_watched_state(ip, capsys, monkeypatch):
+    magic_module = sys.modules["watermark.magic"]
+    calls = []
+    monkeypatch.setattr(magic_module, "_namespace_ids",
+                        lambda ns: calls.append(ns) or {})
+    ip.run_cell("%watermark --watch -g")
+    ip.run_cell("import json as _json_alias")
+    # Without --iversions, the namespace is never scanned
+    assert calls == []
+    assert set(ip.magics_manager.registry["WaterMark"].watcher.state) == \
+        {"git"}
+    capsys.readouterr()
@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import watermark
+from watermark import pypi
+
+
+class _IndexHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    versions = {"pytest": "99.0", "watermark": "99.1"}
+
+    def do_GET(self):
+        self.server.requests.append(self.path)
+        self.server.connections.add(self.client_address)
+        name = self.path.split("/")[-2]
+        if name in self.versions:
+            status = 200
+            body = json.dumps({"info": {"version": self.versions[name]}})
+        else:
+            status, body = 404, "{}"
+        body = body.encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def index(tmp_path, monkeypatch):
+    monkeypatch.setenv("WATERMARK_CACHE_DIR", str(tmp_path))
+    for var in ("http_proxy", "HTTP_PROXY"):
+        monkeypatch.delenv(var, raising=False)
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _IndexHandler)
+    server.requests = []
+    server.connections = set()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server, f"http://127.0.0.1:{server.server_port}/pypi"
+    server.shutdown()
+    server.server_close()
+
+
+def test_batched_lookup_and_cache(index):
+    server, url = index
+    names = ["pytest", "watermark", "no-such-package"]
+    expected = {"pytest": "99.0", "watermark": "99.1",
+                "no-such-package": None}
+    assert pypi.get_latest_versions(names, index_url=url,
+                                    max_workers=1) == expected
+    assert len(server.requests) == 3
+    assert len(server.connections) == 1  # keep-alive connection reused
+
+    assert pypi.get_latest_versions(names, index_url=url) == expected
+    assert len(server.requests) == 3  # served from the disk cache
+
+    pypi.get_latest_versions(names, index_url=url, cache_ttl=0)
+    assert len(server.requests) == 6
+
+
+def test_check_latest_uses_index_url(index):
+    _, url = index
+    text = watermark.watermark(packages="pytest", check_latest=True,
+                               index_url=url)
+    assert "(version 99.0 is available)" in text
+
+
+def test_profile_attributes_connections(index):
+    _, url = index
+    records = []
+    watermark.watermark(packages="pytest,watermark", check_latest=True,
+                        index_url=url, profile=records.extend)
+    assert records[0]["section"] == "packages"
+    assert records[0]["connections"]
+
+
+def test_async_lookup_matches_sync(index):
+    import asyncio
+
+    server, url = index
+    names = ["pytest", "watermark", "no-such-package"]
+    latest = asyncio.run(pypi.aget_latest_versions(names, index_url=url,
+                                                   cache_ttl=0))
+    assert latest == pypi.get_latest_versions(names, index_url=url,
+                                              cache_ttl=0)
+    text = asyncio.run(watermark.awatermark(packages="pytest",
+                                            check_latest=True,
+                                            index_url=url))
+    assert "(version 99.0 is available)" in text
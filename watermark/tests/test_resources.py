@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+import os
+import sys
+
+import pytest
+
+from watermark import resources
+
+
+def _write(path, text):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(text)
+
+
+def _fake_proc(tmp_path, cgroup):
+    proc = tmp_path / "proc"
+    _write(proc / "self" / "status",
+           "Name:\tpython\nVmHWM:\t  2048 kB\nVmRSS:\t  1024 kB\n"
+           "Threads:\t3\n")
+    (proc / "self" / "fd").mkdir()
+    for fd in range(5):
+        (proc / "self" / "fd" / str(fd)).touch()
+    _write(proc / "loadavg", "0.50 0.25 1.00 1/100 4242\n")
+    _write(proc / "cpuinfo",
+           "processor\t: 0\nmodel name\t: Fake CPU\ncpu MHz\t\t: 1000.0\n\n"
+           "processor\t: 1\nmodel name\t: Fake CPU\ncpu MHz\t\t: 3000.0\n")
+    _write(proc / "self" / "cgroup", cgroup)
+    return proc
+
+
+def test_read_cgroup_v2(tmp_path):
+    proc = _fake_proc(tmp_path, "0::/jobs/42\n")
+    root = tmp_path / "cgroup"
+    _write(root / "jobs" / "cpu.max", "200000 100000\n")
+    _write(root / "jobs" / "memory.max", "1073741824\n")
+    _write(root / "jobs" / "42" / "cpu.max", "max 100000\n")
+    _write(root / "jobs" / "42" / "memory.max", "max\n")
+
+    assert resources.read(str(proc), str(root)) == {
+        "rss": 1024 * 1024,
+        "peak_rss": 2048 * 1024,
+        "threads": 3,
+        # The descriptor of the listed directory is not counted
+        "open_fds": 4,
+        "cpu_limit": 2.0,
+        "memory_limit": 2**30,
+        "loadavg": (0.5, 0.25, 1.0),
+        "cpu_model": "Fake CPU",
+        "cpu_mhz": 2000.0,
+    }
+
+
+def test_read_cgroup_v1(tmp_path):
+    # In a cgroup namespace, only the mount of the own cgroup exists
+    proc = _fake_proc(tmp_path, "4:memory:/host/container\n"
+                                "2:cpu,cpuacct:/host/container\n0::/\n")
+    root = tmp_path / "cgroup"
+    _write(root / "cpu,cpuacct" / "cpu.cfs_quota_us", "50000\n")
+    _write(root / "cpu,cpuacct" / "cpu.cfs_period_us", "100000\n")
+    _write(root / "memory" / "memory.limit_in_bytes",
+           "9223372036854771712\n")
+
+    info = resources.read(str(proc), str(root))
+    assert info["cpu_limit"] == 0.5
+    assert info["memory_limit"] is None
+    assert resources.read(str(tmp_path / "missing")) is None
+
+
+@pytest.mark.skipif(not sys.platform.startswith("linux"),
+                    reason="requires /proc")
+def test_read_own_process():
+    info = resources.read()
+    assert info["rss"] > 0
+    assert info["peak_rss"] >= info["rss"]
+    assert info["threads"] >= 1
+    with open(os.devnull) as f:
+        assert resources.read()["open_fds"] == info["open_fds"] + 1
@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+import io
+import json
+
+from watermark import cli
+from watermark import snapshot
+
+
+def test_snapshot_formats(tmp_path, capsys):
+    first, second = tmp_path / "first", tmp_path / "second"
+    for site in (first, second):
+        site.mkdir()
+    (first / "Foo_Bar-1.0.dist-info").mkdir()
+    (first / "Foo_Bar-1.0.dist-info" / "METADATA").write_text(
+        "Metadata-Version: 2.1\nName: Foo.Bar\nVersion: 1.0\n\n"
+        "Version: not-a-header\n")
+    (first / "legacy-0.3-py3.11.egg-info").write_text(
+        "Metadata-Version: 1.0\nName: legacy\nVersion: 0.3\n")
+    (second / "foo_bar-2.0.dist-info").mkdir()
+    (second / "foo_bar-2.0.dist-info" / "METADATA").write_text(
+        "Name: foo-bar\nVersion: 2.0\n")
+    paths = [str(first), str(second), str(tmp_path / "missing")]
+
+    out = io.StringIO()
+    assert snapshot.write_snapshot(out, paths=paths) == 2
+    assert [json.loads(line) for line in out.getvalue().splitlines()] == [
+        {"name": "Foo.Bar", "version": "1.0", "location": str(first)},
+        {"name": "legacy", "version": "0.3", "location": str(first)},
+    ]
+
+    lockfile = tmp_path / "requirements.txt"
+    snapshot.write_snapshot(str(lockfile), format="requirements",
+                            paths=paths)
+    assert lockfile.read_text() == "Foo.Bar==1.0\nlegacy==0.3\n"
+
+
+def test_snapshot_cli(capsys):
+    assert cli.main(["--snapshot", "--snapshot_format", "requirements"]) == 0
+    lines = capsys.readouterr().out.splitlines()
+    assert any(line.startswith("pytest==") for line in lines)
@@ -1,5 +1,6 @@
 # -*- coding: utf-8 -*-
 
+import subprocess
 import sys
 import os
 from pathlib import Path
@@ -40,3 +41,340 @@ def test_sorted_iversion():
     a = watermark.watermark(iversions=True, globals_=globals())
     pkgs = a.strip().split("\n")
     assert pkgs == sorted(pkgs), f"{pkgs =}\n{sorted(pkgs)=}"
+
+
+def test_import_does_not_load_ipython():
+    code = (
+        "import sys, watermark; "
+        "assert 'IPython' not in sys.modules, 'IPython'; "
+        "assert 'py3nvml' not in sys.modules, 'py3nvml'; "
+        "watermark.watermark(hostname=True); "
+        "assert 'IPython' not in sys.modules, 'IPython after call'"
+    )
+    root = Path(__file__).resolve().parents[2]
+    proc = subprocess.run([sys.executable, "-c", code], cwd=root,
+                          capture_output=True, text=True)
+    assert proc.returncode == 0, proc.stderr
+
+
+def test_magic_is_loaded_on_demand():
+    assert callable(watermark.load_ipython_extension)
+    assert watermark.magic.WaterMark is watermark.WaterMark
+
+
+def test_concurrent_matches_serial():
+    kwargs = dict(machine=True, githash=True, gitrepo=True, gitbranch=True,
+                  packages="pytest,watermark", jupyter_env=True)
+    serial = watermark.watermark(max_workers=1, **kwargs)
+    concurrent = watermark.watermark(**kwargs)
+    assert serial == concurrent
+
+
+def test_import_tracker_only_resolves_changes(monkeypatch):
+    wm_module = sys.modules["watermark.watermark"]
+
+    calls = []
+    resolve = wm_module._top_level_package
+
+    def counting(val):
+        calls.append(val)
+        return resolve(val)
+
+    monkeypatch.setattr(wm_module, "_top_level_package", counting)
+    tracker = wm_module.ImportTracker()
+    ns = {"os": os, "Path": Path, "x": 1}
+    assert tracker.update(ns) == {"os", "pathlib"}
+    assert len(calls) == 2
+
+    ns["subprocess"] = subprocess
+    del ns["Path"]
+    assert tracker.update(ns) == {"os", "subprocess"}
+    assert len(calls) == 3
+
+
+def _class_of(module):
+    return type("Tracked", (), {"__module__": module})
+
+
+def test_import_tracker_reused_id(monkeypatch):
+    import gc
+    wm_module = sys.modules["watermark.watermark"]
+    # Pretend that the second class is allocated at the address of the
+    # first, freed one
+    monkeypatch.setattr(wm_module, "id", lambda val: 1, raising=False)
+    tracker = wm_module.ImportTracker()
+    ns = {"x": _class_of("pkg_a.sub")}
+    assert tracker.update(ns) == {"pkg_a"}
+
+    ns["x"] = _class_of("pkg_b")
+    gc.collect()
+    assert tracker.update(ns) == {"pkg_b"}
+    assert tracker.update(ns) == {"pkg_b"}
+
+
+def test_import_tracker_collection_during_update(monkeypatch):
+    import gc
+    import weakref
+    wm_module = sys.modules["watermark.watermark"]
+    resolve = wm_module._top_level_package
+
+    def collecting(val):
+        # Classes are freed by the cycle collector, which may run on
+        # any allocation while update() resolves new names
+        gc.collect()
+        return resolve(val)
+
+    tracker = wm_module.ImportTracker()
+    ns = {"a": _class_of("pkg_a"), "b": _class_of("pkg_b")}
+    assert tracker.update(ns) == {"pkg_a", "pkg_b"}
+    freed = weakref.ref(ns.pop("a"))
+    ns["c"] = _class_of("pkg_c")
+    monkeypatch.setattr(wm_module, "_top_level_package", collecting)
+    assert tracker.update(ns) == {"pkg_b", "pkg_c"}
+    assert freed() is None
+    assert tracker.update(ns) == {"pkg_b", "pkg_c"}
+    assert set(tracker._refs) == set(tracker._ids) == {"b", "c"}
+
+    # The tracker itself is not kept alive by its weakref callbacks
+    tracker = weakref.ref(tracker)
+    gc.collect()
+    assert tracker() is None
+
+
+def test_static_facts_are_reused_from_disk(tmp_path, monkeypatch):
+    wm_module = sys.modules["watermark.watermark"]
+    monkeypatch.setenv("WATERMARK_CACHE_DIR", str(tmp_path))
+    monkeypatch.setattr(wm_module, "_static_facts", None)
+    sysinfo = wm_module._get_sysinfo()
+    assert len(list(tmp_path.glob("facts-*.json"))) == 1
+
+    # A fresh process only needs to read the cache file
+    def fail():
+        raise AssertionError("recomputed")
+
+    monkeypatch.setattr(wm_module, "_static_facts", None)
+    monkeypatch.setattr(wm_module, "_compute_sysinfo", fail)
+    assert wm_module._get_sysinfo() == sysinfo
+
+
+def test_structured_output():
+    sections = watermark.watermark(output_format="dict")
+    assert list(sections) == ["last_updated", "python", "machine"]
+    assert isinstance(sections["machine"]["CPU cores"], int)
+    assert "IPython version" in sections["python"]
+
+    import json
+    kwargs = dict(packages="pytest", hostname=True, githash=True)
+    as_json = json.loads(watermark.watermark(output_format="json", **kwargs))
+    assert as_json == watermark.watermark(output_format="dict", **kwargs)
+    assert list(as_json) == ["packages", "hostname", "git_hash"]
+
+
+def test_profile_records_subprocesses(monkeypatch):
+    import shutil
+    if shutil.which("git") is None:
+        return
+    # GIT_DIR makes the Git collector fall back to the git executable
+    root = Path(__file__).resolve().parents[2]
+    monkeypatch.setenv("GIT_DIR", str(root / ".git"))
+    records = []
+    watermark.watermark(githash=True, profile=records.extend)
+    assert [r["section"] for r in records] == ["git", "total"]
+    assert records[0]["subprocesses"] == ["git rev-parse HEAD",
+                                          "git rev-parse --abbrev-ref HEAD",
+                                          "git config --get remote.origin.url"]
+
+    text = watermark.watermark(githash=True, profile=True)
+    assert "Profile git" in text and "3 subprocesses" in text
+
+
+def test_profile_wrappers_are_removed():
+    import socket
+
+    popen_init = subprocess.Popen.__init__
+
+    def collector():
+        subprocess.run([sys.executable, "-c", "pass"])
+        with socket.socket() as sock:
+            try:
+                sock.connect(("127.0.0.1", 9))
+            except OSError:
+                pass
+
+    from watermark import profiling
+
+    record = profiling.new_record("test")
+    profiling.timed(record, collector)()
+    assert len(record["subprocesses"]) == 1
+    assert record["connections"] == ["127.0.0.1:9"]
+    # Nothing stays installed after the profiled run
+    assert subprocess.Popen.__init__ is popen_init
+    assert "connect" not in vars(socket.socket)
+
+
+def test_timeout_returns_partial_results(monkeypatch):
+    import time
+    wm_module = sys.modules["watermark.watermark"]
+
+    def hung_gpu():
+        time.sleep(5)
+
+    monkeypatch.setattr(wm_module, "_get_gpu_info", hung_gpu)
+    start = time.monotonic()
+    sections = watermark.watermark(gpu=True, hostname=True, machine=True,
+                                   timeout=0.2, output_format="dict")
+    assert time.monotonic() - start < 2
+    assert sections["gpu"] == {"GPU Info": "n/a (timed out after 0.2 s)"}
+    assert "Hostname" in sections["hostname"]
+    assert "CPU cores" in sections["machine"]
+
+
+def test_timeout_with_one_worker(monkeypatch):
+    import time
+    wm_module = sys.modules["watermark.watermark"]
+
+    def hung_gpu():
+        time.sleep(5)
+
+    monkeypatch.setattr(wm_module, "_get_gpu_info", hung_gpu)
+    start = time.monotonic()
+    sections = watermark.watermark(gpu=True, hostname=True, max_workers=1,
+                                   timeout=0.2, output_format="dict")
+    assert time.monotonic() - start < 2
+    assert sections["gpu"] == {"GPU Info": "n/a (timed out after 0.2 s)"}
+    assert "Hostname" in sections["hostname"]
+
+
+def test_awatermark_matches_watermark(monkeypatch):
+    import asyncio
+    import time
+    wm_module = sys.modules["watermark.watermark"]
+
+    kwargs = dict(githash=True, gitbranch=True, machine=True,
+                  packages="pytest", output_format="dict")
+    expected = watermark.watermark(**kwargs)
+    assert asyncio.run(watermark.awatermark(**kwargs)) == expected
+
+    def hung_gpu():
+        time.sleep(5)
+
+    monkeypatch.setattr(wm_module, "_get_gpu_info", hung_gpu)
+    start = time.monotonic()
+    sections = asyncio.run(watermark.awatermark(
+        gpu=True, hostname=True, timeout=0.2, output_format="dict"))
+    assert time.monotonic() - start < 2
+    assert sections["gpu"] == {"GPU Info": "n/a (timed out after 0.2 s)"}
+    assert "Hostname" in sections["hostname"]
+
+
+def test_awatermark_keeps_file_access_off_the_loop(monkeypatch):
+    import asyncio
+    import threading
+    wm_module = sys.modules["watermark.watermark"]
+
+    threads = {}
+
+    def recording(name, func):
+        def run(*args):
+            threads[name] = threading.get_ident()
+            return func(*args)
+        monkeypatch.setattr(wm_module, name, run)
+
+    for name in ("_get_pyversions", "_get_all_import_versions",
+                 "_get_python_installation_section", "_get_resources",
+                 "_add_conda_builds"):
+        recording(name, getattr(wm_module, name))
+
+    async def main():
+        loop_thread = threading.get_ident()
+        await watermark.awatermark(
+            python=True, iversions=True, globals_=globals(),
+            python_installation=True, resources=True, conda=True,
+            packages="pytest")
+        return loop_thread
+
+    loop_thread = asyncio.run(main())
+    assert len(threads) == 5
+    assert loop_thread not in threads.values()
+
+
+def test_fingerprint_tracks_installed_distributions(tmp_path, monkeypatch):
+    monkeypatch.setenv("WATERMARK_CACHE_DIR", str(tmp_path / "cache"))
+    site = tmp_path / "site"
+    site.mkdir()
+    monkeypatch.syspath_prepend(str(site))
+
+    def fingerprint():
+        sections = watermark.watermark(fingerprint=True, output_format="dict")
+        return sections["fingerprint"]["Fingerprint"]
+
+    before = fingerprint()
+    assert len(before) == 16 and fingerprint() == before
+    (site / "newdist-1.0.dist-info").mkdir()
+    assert fingerprint() != before
+
+
+def test_diff_against_baseline(tmp_path):
+    import json
+
+    import pytest
+
+    baseline = watermark.watermark(python=True, machine=True,
+                                   packages="pytest", author="a",
+                                   output_format="dict")
+    path = tmp_path / "baseline.json"
+    path.write_text(json.dumps(baseline))
+    assert watermark.watermark(diff_against=str(path)) == \
+        f"No changes since {path}"
+
+    baseline["packages"]["pytest"] = "0.1"
+    baseline["packages"]["not-installed-pkg"] = "1.0"
+    del baseline["machine"]["OS"]
+    baseline["author"]["Author"] = "b"
+    path.write_text(json.dumps(baseline))
+    diff = watermark.watermark(diff_against=str(path), output_format="dict")
+    assert diff["changed"] == {
+        "packages": {"pytest": ["0.1", pytest.__version__],
+                     "not-installed-pkg": ["1.0", "unknown"]}}
+    assert list(diff["added"]) == ["machine"]
+    assert list(diff["added"]["machine"]) == ["OS"]
+    assert diff["removed"] == {}
+    text = watermark.watermark(diff_against=str(path))
+    assert f"~ packages / pytest: 0.1 -> {pytest.__version__}" in text
+
+
+def test_package_patterns():
+    packages = watermark.watermark(packages="py*,pytest,re:pl.ggy,nomatch*",
+                                   output_format="dict")["packages"]
+    names = list(packages)
+    assert names.count("pytest") == 1
+    assert "pluggy" in names
+    assert packages["nomatch*"] == "unknown"
+    py = [n for n in names if n.lower().startswith("py")]
+    assert py == sorted(py, key=watermark.distributions.normalize_name)
+
+
+def test_verify_packages():
+    packages = watermark.watermark(packages="pytest,nomatch", verify=True,
+                                   output_format="dict")["packages"]
+    assert packages["pytest"].endswith(" (OK)")
+    assert packages["nomatch"] == "unknown"
+
+
+def test_resources_section():
+    section = watermark.watermark(resources=True,
+                                  output_format="dict")["resources"]
+    if sys.platform.startswith("linux"):
+        assert section["RSS"].endswith(" MiB")
+        assert section["Threads"] >= 1
+    else:
+        assert section == {"Resources": "n/a (no /proc file system)"}
+
+
+def test_overlapping_package_patterns():
+    for pkgs in ("py*,pytes?", "re:.*test,pytest*"):
+        packages = watermark.watermark(packages=pkgs,
+                                       output_format="dict")["packages"]
+        assert "pytest" in packages
+        assert not any(watermark.distributions.is_pattern(name)
+                       for name in packages)
@@ -1,10 +1,20 @@
-try:
-    import importlib.metadata as importlib_metadata
-except ImportError:
-    # Running on pre-3.8 Python; use importlib-metadata package
-    import importlib_metadata
-
-try:
-    __version__ = importlib_metadata.version("watermark")
-except Exception:
-    __version__ = "unknown"
+def _get_version():
+    try:
+        import importlib.metadata as importlib_metadata
+    except ImportError:
+        # Running on pre-3.8 Python; use importlib-metadata package
+        import importlib_metadata
+
+    try:
+        return importlib_metadata.version("watermark")
+    except Exception:
+        return "unknown"
+
+
+def __getattr__(name):
+    # Resolved lazily since importing importlib.metadata and scanning
+    # sys.path is a noticeable part of the package import time.
+    if name == "__version__":
+        globals()["__version__"] = _get_version()
+        return globals()["__version__"]
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
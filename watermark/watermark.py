@@ -10,30 +10,23 @@ License: BSD 3 clause
 from __future__ import absolute_import
 
 import datetime
-import inspect
 import os
 import platform
-import subprocess
+import sys
+import threading
 import time
 import types
-from multiprocessing import cpu_count
+import weakref
 from socket import gethostname
 
+from . import cache
+from . import conda
+from . import distributions
+from . import gitinfo
+from . import version
 
-try:
-    from py3nvml import py3nvml
-except ImportError:
-    py3nvml = None
-
-try:
-    import importlib.metadata as importlib_metadata
-except ImportError:
-    # Running on pre-3.8 Python; use importlib-metadata package
-    import importlib_metadata
-
-import IPython
-
-from .version import __version__
+# Upper bound on the threads used for blocking sections.
+_MAX_WORKERS = 8
 
 
 def watermark(
@@ -56,14 +49,25 @@ def watermark(
         githash=False,
         gitrepo=False,
         gitbranch=False,
+        gitdirty=False,
         watermark=False,
         iversions=False,
         gpu=False,
         jupyter_env=False,
         python_installation=False,
+        fingerprint=False,
+        resources=False,
         check_latest=False,
+        index_url=None,
+        import_fallback=False,
+        verify=False,
         watermark_self=None,
-        globals_=None
+        globals_=None,
+        max_workers=None,
+        output_format="text",
+        profile=False,
+        timeout=None,
+        diff_against=None
 ):
 
     '''Function to print date/time stamps and various system information.
@@ -109,10 +113,15 @@ def watermark(
         prints Python and IPython version (if running from Jupyter)
 
     packages :
-        prints versions of specified Python modules and packages
+        prints versions of specified Python modules and packages;
+        comma-separated names, globs (e.g., `torch*`) or regular
+        expressions prefixed with `re:` (e.g., `re:jax(lib)?`), which
+        are matched against the installed distributions
 
     conda :
-        prints name of current conda environment
+        prints name of current conda environment; together with
+        `packages` or `iversions`, also prints the build and channel of
+        packages installed by conda (read from `conda-meta`)
 
     hostname :
         prints the host name
@@ -129,6 +138,11 @@ def watermark(
     gitbranch :
         prints current Git branch
 
+    gitdirty :
+        prints whether tracked files in the Git work tree were modified
+        (a fast stat-based check against the index; untracked files and
+        staged changes are not considered)
+
     watermark :
         prints the current version of watermark
 
@@ -138,34 +152,152 @@ def watermark(
     gpu :
         prints GPU information (currently limited to NVIDIA GPUs), if available
 
+    fingerprint :
+        prints a short digest of the interpreter, the installed
+        distributions, the Git commit and the host; it changes whenever
+        one of them does
+
+    resources :
+        prints the memory (RSS and peak RSS), thread and open file counts
+        of the process, the cgroup CPU and memory limits, the load
+        average and the CPU model and frequency, read from `/proc`
+
+    check_latest :
+        check if the latest versions of `packages` are installed; lookups
+        run concurrently and are cached on disk for an hour
+
+    index_url :
+        URL of a PyPI-compatible JSON API used by `check_latest`
+        (default: `WATERMARK_INDEX_URL` or https://pypi.org/pypi)
+
+    import_fallback :
+        import modules that have neither distribution metadata nor a
+        statically readable `__version__` to look up their version
+        (this runs the module's import side effects)
+
+    verify :
+        checks the installed files of `packages` and `iversions`
+        against the sha256 hashes in their distribution's `RECORD` and
+        appends "OK", the number of modified and missing files, or "no
+        RECORD" to their versions
+
     watermark_self :
         instance of the watermark magics class, which is required
         for iversions.
 
+    max_workers :
+        maximum number of threads used to run blocking sections
+        (git, GPU, package and system queries) concurrently;
+        1 runs all sections serially. The output is the same either way.
+
+    output_format :
+        "text" (default) returns the formatted string; "dict" returns an
+        ordered dict mapping section names (e.g., "python", "machine",
+        "packages", "git_hash") to dicts of typed values; "json" returns
+        that dict serialized as JSON.
+
+    profile :
+        records the wall time, subprocesses and network connections of
+        each section. True appends them as a "Profile" section; a
+        logger receives one INFO message per section, and any other
+        callable is called with the list of records.
+
+    timeout :
+        time budget in seconds for the blocking sections (Git, GPU,
+        packages, system info). Sections that do not finish in time are
+        reported as "n/a (timed out after <timeout> s)", and `git`
+        processes still running at the deadline are killed.
+
+    diff_against :
+        path of a baseline saved with `output_format="json"`, or such a
+        baseline as a dict. Only the sections present in the baseline are
+        collected (the packages listed there for "packages"), and only
+        the keys that were added, removed or changed are returned, in
+        `output_format`. Date/time and author sections are not compared.
+
     '''
-    output = []
-    args = locals()
+    collectors, options = _plan(locals())
+    records = _profile_records(collectors, options)
+    if records is not None:
+        from . import profiling
+
+        collectors = [
+            (name, profiling.timed(record, collector), args, blocking)
+            for (name, collector, args, blocking), record
+            in zip(collectors, records)
+        ]
+    results = _run_collectors(
+        [collector[1:] for collector in collectors],
+        options["max_workers"], options["deadline"])
+    return _finish(collectors, results, options, records)
+
+
+async def awatermark(**kwargs):
+    """Coroutine version of `watermark()`, accepting the same parameters.
+
+    Git subprocesses run via `asyncio.create_subprocess_exec` and
+    `check_latest` uses asyncio network I/O, so neither blocks the event
+    loop; the remaining probes that may block (GPU, system info, file
+    system reads) run in the loop's default executor.
+    """
+    import inspect
+
+    bound = inspect.signature(watermark).bind(**kwargs)
+    bound.apply_defaults()
+    collectors, options = _plan(bound.arguments)
+    records = _profile_records(collectors, options)
+    results = await _arun_collectors(collectors, options, records)
+    return _finish(collectors, results, options, records)
+
+
+def _plan(args):
+    """Turn the arguments of `watermark()` into the list of
+    `(name, collector, args, blocking)` entries and the run options
+    shared by the sync and async front ends."""
+    args = dict(args)
     watermark_self = args['watermark_self']
     del args['watermark_self']
+    max_workers = args.pop('max_workers')
+    output_format = args.pop('output_format')
+    profile = args.pop('profile')
+    timeout = args.pop('timeout')
+    deadline = None if timeout is None else time.monotonic() + timeout
+    if output_format not in ("text", "dict", "json"):
+        raise ValueError(
+            f"output_format must be 'text', 'dict' or 'json', "
+            f"got {output_format!r}")
+    index_url = args.pop('index_url')
+    import_fallback = args.pop('import_fallback')
+    verify = args.pop('verify')
+    baseline = None
+    diff_against = args.pop('diff_against')
+    if diff_against is not None:
+        baseline = _load_baseline(diff_against)
+        _select_baseline_sections(args, baseline, watermark_self)
+
+    collectors = []
+
+    def add(name, collector, *collector_args, blocking=False):
+        collectors.append((name, collector, collector_args, blocking))
 
     if not any(args.values()) or args['iso8601']:
         iso_dt = _get_datetime()
 
     if not any(args.values()):
         args['updated'] = True
-        output.append({"Last updated": iso_dt})
-        output.append(_get_pyversions())
-        output.append(_get_sysinfo())
+        add("last_updated", _static, {"Last updated": iso_dt})
+        add("python", _get_pyversions)
+        add("machine", _get_sysinfo, blocking=True)
     else:
         if args['author']:
-            output.append({"Author": args['author'].strip("'\"")})
+            add("author", _static, {"Author": args['author'].strip("'\"")})
         if args['github_username']:
-            output.append({"Github username": \
-                               args['github_username'].strip("'\"")})
+            add("github_username", _static,
+                {"Github username": args['github_username'].strip("'\"")})
         if args['email']:
-            output.append({"Email": args['email'].strip("'\"")})
+            add("email", _static, {"Email": args['email'].strip("'\"")})
         if args['website']:
-            output.append({"Website": args['website'].strip("'\"")})
+            add("website", _static, {"Website": args['website'].strip("'\"")})
         if args['updated']:
             value = ""
             if args['custom_time']:
@@ -185,54 +317,433 @@ def watermark(
                         time_str += " " + time.strftime("%Z")
                     values.append(time_str)
                 value = " ".join(values)
-            output.append({"Last updated": value})
+            add("last_updated", _static, {"Last updated": value})
         elif args['current_date'] or args['current_time']:
             if args['current_date'] and args['current_time']:
                 date_str = time.strftime("%Y-%m-%d")
                 time_str = time.strftime("%H:%M:%S")
-                output.append({"Date/Time": f"{date_str} {time_str}"})
+                add("date_time", _static,
+                    {"Date/Time": f"{date_str} {time_str}"})
             elif args['current_date']:
-                output.append({"Date": time.strftime("%Y-%m-%d")})
+                add("date", _static, {"Date": time.strftime("%Y-%m-%d")})
             elif args['current_time']:
-                output.append({"Time": time.strftime("%H:%M:%S")})
+                add("time", _static, {"Time": time.strftime("%H:%M:%S")})
         if args['python']:
-            output.append(_get_pyversions())
+            add("python", _get_pyversions)
         if args['packages']:
             check_latest = args.get('check_latest', False)
-            output.append(_get_packages(args['packages'], check_latest))
+            add("packages", _get_packages, args['packages'], check_latest,
+                index_url, import_fallback, deadline, args['conda'], verify,
+                blocking=True)
         if args['conda']:
-            output.append(_get_conda_env())
+            add("conda", _get_conda_env)
         if args['machine']:
-            output.append(_get_sysinfo())
+            add("machine", _get_sysinfo, blocking=True)
         if args['hostname']:
-            output.append({"Hostname": gethostname()})
-        if args['githash']:
-            output.append(_get_commit_hash(bool(args['machine'])))
-        if args['gitrepo']:
-            output.append(_get_git_remote_origin(bool(args['machine'])))
-        if args['gitbranch']:
-            output.append(_get_git_branch(bool(args['machine'])))
+            add("hostname", _static, {"Hostname": gethostname()})
+        if (args['githash'] or args['gitrepo'] or args['gitbranch']
+                or args['gitdirty']):
+            add(None, _get_git_sections, args['githash'], args['gitrepo'],
+                args['gitbranch'], args['gitdirty'], deadline, blocking=True)
         if args['iversions']:
+            tracker = None
             if watermark_self:
                 ns = watermark_self.shell.user_ns
-            elif globals_:
-                ns = globals_
+                tracker = getattr(watermark_self, 'import_tracker', None)
+            elif args['globals_']:
+                ns = args['globals_']
             else:
                 raise RuntimeError(
                     "Either `watermark_self` or `globals_` must be provided "
                     "to show imported package versions."
                 )
-            output.append(_get_all_import_versions(ns))
+            add("iversions", _get_all_import_versions, ns, import_fallback,
+                tracker, args['conda'], verify, blocking=verify)
         if args['gpu']:
-            output.append(_get_gpu_info())
+            add("gpu", _get_gpu_info, blocking=True)
         if args['python_installation']:
-            output.append({"Python installation": _get_python_installation()})
+            add("python_installation", _get_python_installation_section)
         if args['jupyter_env']:
-            output.append({"Jupyter enviroment": _get_jupyter_env()})
+            add("jupyter_env", _get_jupyter_section, blocking=True)
+        if args['fingerprint']:
+            add("fingerprint", _get_fingerprint, deadline, blocking=True)
+        if args['resources']:
+            add("resources", _get_resources)
         if args['watermark']:
-            output.append({"Watermark": __version__})
+            add("watermark", _static, {"Watermark": version.__version__})
+
+    options = {
+        "max_workers": max_workers,
+        "output_format": output_format,
+        "profile": profile,
+        "timeout": timeout,
+        "deadline": deadline,
+        "start": time.perf_counter(),
+        "baseline": baseline,
+        "diff_against": diff_against,
+    }
+    return collectors, options
+
+
+# Baseline sections that are collected again by `diff_against`, and the
+# `watermark()` argument that enables them. Date/time and author
+# sections are not comparable.
+_DIFF_SECTIONS = {
+    "python": "python",
+    "machine": "machine",
+    "hostname": "hostname",
+    "conda": "conda",
+    "git_hash": "githash",
+    "git_repo": "gitrepo",
+    "git_branch": "gitbranch",
+    "git_dirty": "gitdirty",
+    "watermark": "watermark",
+    "iversions": "iversions",
+    "gpu": "gpu",
+    "python_installation": "python_installation",
+    "jupyter_env": "jupyter_env",
+    "fingerprint": "fingerprint",
+}
+
+
+def _load_baseline(path):
+    import json
+
+    if isinstance(path, dict):
+        return path
+    with open(path, encoding="utf-8") as f:
+        baseline = json.load(f)
+    if not isinstance(baseline, dict) or not all(
+            isinstance(section, dict) for section in baseline.values()):
+        raise ValueError(
+            f"{path} is not a watermark saved with output_format='json'")
+    return baseline
+
+
+def _select_baseline_sections(args, baseline, watermark_self):
+    """Enable exactly the comparable sections of `baseline` in `args`."""
+    for name in args:
+        if name not in ('globals_', 'check_latest'):
+            args[name] = None if name == 'packages' else False
+    for section in baseline:
+        if section == "packages":
+            args['packages'] = ",".join(baseline["packages"])
+        elif section in _DIFF_SECTIONS:
+            args[_DIFF_SECTIONS[section]] = True
+    if args['iversions'] and not (watermark_self or args['globals_']):
+        args['iversions'] = False
+    if not any(args[name] for name in _DIFF_SECTIONS.values()) \
+            and not args['packages']:
+        raise ValueError("the baseline has no sections that can be compared")
+
+
+def _diff_sections(baseline, sections):
+    """Return the keys of `sections` that were added, removed or changed
+    with respect to `baseline`, by kind and section."""
+    baseline = _comparable_values(baseline)
+    current = _comparable_values(sections)
+    diff = {"added": {}, "removed": {}, "changed": {}}
+    for section, new in current.items():
+        old = baseline.get(section, {})
+        for key, value in old.items():
+            if key not in new:
+                diff["removed"].setdefault(section, {})[key] = value
+            elif new[key] != value:
+                diff["changed"].setdefault(section, {})[key] = \
+                    [value, new[key]]
+        for key in new.keys() - old.keys():
+            diff["added"].setdefault(section, {})[key] = new[key]
+    return diff
+
+
+# Facts of a GPU device that are compared; memory usage and utilization
+# change between any two calls
+_GPU_FACTS = ("name", "uuid", "pci_bus_id", "memory_total")
+
+
+def _comparable_values(sections):
+    """Return `sections` as JSON values, as stored in a baseline, with
+    the GPU devices reduced to their static facts, one key per fact."""
+    import json
+
+    sections = json.loads(json.dumps(sections, default=str))
+    gpu = sections.get("gpu")
+    if gpu and isinstance(gpu.get("GPU Info"), list):
+        devices = gpu.pop("GPU Info")
+        for device in devices:
+            for fact in _GPU_FACTS:
+                gpu[f"GPU {device.get('index')} {fact}"] = device.get(fact)
+    return sections
+
+
+def _format_diff(diff, path):
+    lines = _diff_lines(diff)
+    if not lines:
+        return f"No changes since {path}"
+    return f"Changes since {path}:\n" + "\n".join(lines)
+
+
+def _diff_lines(diff):
+    lines = []
+    for kind, marker in (("changed", "~"), ("added", "+"),
+                         ("removed", "-")):
+        for section, values in diff[kind].items():
+            for key, value in values.items():
+                if kind == "changed":
+                    value = f"{value[0]} -> {value[1]}"
+                lines.append(f"{marker} {section} / {key}: {value}")
+    return lines
+
+
+def _profile_records(collectors, options):
+    if not options["profile"]:
+        return None
+    from . import profiling
+
+    return [profiling.new_record(name or "git")
+            for name, _, _, _ in collectors]
+
+
+def _finish(collectors, results, options, records=None):
+    """Assemble the collector results into sections and render them."""
+    timeout = options["timeout"]
+    sections = {}
+    for (name, *_), result in zip(collectors, results):
+        if result is _TIMED_OUT:
+            name = name or "git"
+            sections[name] = {
+                _TIMEOUT_LABELS.get(name, name.capitalize()):
+                    f"n/a (timed out after {timeout:g} s)"
+            }
+        elif name is None:
+            # Collectors that read shared state once return several
+            # named sections
+            sections.update(result)
+        else:
+            sections[name] = result
+
+    if records is not None:
+        from . import profiling
+
+        total = profiling.new_record("total")
+        total["seconds"] = time.perf_counter() - options["start"]
+        section = profiling.report(records + [total], options["profile"])
+        if section is not None:
+            sections["profile"] = section
+
+    output_format = options["output_format"]
+    if options["baseline"] is not None:
+        diff = _diff_sections(options["baseline"], sections)
+        if output_format == "text":
+            source = options["diff_against"]
+            return _format_diff(diff, source if not isinstance(source, dict)
+                                else "the baseline")
+        sections = diff
+    if output_format == "dict":
+        return sections
+    if output_format == "json":
+        import json
+        return json.dumps(sections, default=str)
+    return _generate_formatted_text(list(sections.values()))
+
+
+def _static(section):
+    return section
+
+
+# Returned by _run_collectors() for collectors that missed the deadline.
+_TIMED_OUT = object()
+
+# Keys of the placeholder sections reported for timed-out collectors
+_TIMEOUT_LABELS = {
+    "machine": "System info",
+    "git": "Git",
+    "gpu": "GPU Info",
+    "jupyter_env": "Jupyter enviroment",
+}
+
+
+def _run_collectors(collectors, max_workers=None, deadline=None):
+    """Run ``(collector, args, blocking)`` entries and return their
+    sections in the original order.
+
+    Blocking collectors (subprocesses, network, driver calls) are
+    submitted to a bounded thread pool first; the cheap ones then run
+    inline while the pool works. If a `deadline` (a `time.monotonic()`
+    value) is given, blocking collectors that have not finished by then
+    are reported as `_TIMED_OUT`.
+    """
+    if max_workers is None:
+        max_workers = _MAX_WORKERS
+    n_blocking = sum(1 for _, _, blocking in collectors if blocking)
+    if deadline is not None and n_blocking:
+        # Even serially, a hung collector must not block past the
+        # deadline, so blocking collectors run on threads with one slot
+        return _run_collectors_until(collectors, max(1, max_workers),
+                                     deadline)
+    if n_blocking < 2 or max_workers <= 1:
+        return [collector(*args) for collector, args, _ in collectors]
+
+    from concurrent.futures import ThreadPoolExecutor
+
+    with ThreadPoolExecutor(max_workers=min(max_workers, n_blocking)) as ex:
+        futures = {
+            i: ex.submit(collector, *args)
+            for i, (collector, args, blocking) in enumerate(collectors)
+            if blocking
+        }
+        return [
+            futures[i].result() if i in futures else collector(*args)
+            for i, (collector, args, _) in enumerate(collectors)
+        ]
+
+
+def _run_collectors_until(collectors, max_workers, deadline):
+    # Daemon threads rather than a ThreadPoolExecutor, whose workers are
+    # joined at interpreter exit: a collector stuck in a driver call
+    # must not keep the process alive.
+    slots = threading.BoundedSemaphore(max_workers)
+    done = {}
+
+    def run(i, collector, args):
+        with slots:
+            if time.monotonic() >= deadline:
+                return
+            try:
+                done[i] = (True, collector(*args))
+            except BaseException as e:
+                done[i] = (False, e)
+
+    threads = {}
+    for i, (collector, args, blocking) in enumerate(collectors):
+        if blocking:
+            threads[i] = threading.Thread(
+                target=run, args=(i, collector, args),
+                name="watermark-collector", daemon=True)
+            threads[i].start()
+
+    results = []
+    for i, (collector, args, blocking) in enumerate(collectors):
+        if not blocking:
+            results.append(collector(*args))
+            continue
+        threads[i].join(max(0.0, deadline - time.monotonic()))
+        if i not in done:
+            results.append(_TIMED_OUT)
+            continue
+        ok, value = done[i]
+        if not ok:
+            raise value
+        results.append(value)
+    return results
+
+
+async def _arun_collectors(collectors, options, records=None):
+    """asyncio counterpart of `_run_collectors()`.
+
+    Blocking collectors with a coroutine version in `_ASYNC_COLLECTORS`
+    run as tasks, the others in the default executor; at most
+    `max_workers` of them run at once. Collectors that are cheap enough
+    to run inline in `watermark()` but may still touch the file system
+    (e.g., to build the distribution index) run in the executor as
+    well; only those in `_LOOP_SAFE_COLLECTORS` run on the event loop.
+    """
+    import asyncio
+    from . import profiling
+
+    slots = asyncio.Semaphore(options["max_workers"] or _MAX_WORKERS)
+    deadline = options["deadline"]
+
+    async def run_blocking(i, collector, args):
+        acollector = _ASYNC_COLLECTORS.get(collector)
+        if records is not None:
+            if acollector is not None:
+                acollector = profiling.atimed(records[i], acollector)
+            else:
+                collector = profiling.timed(records[i], collector)
+        async with slots:
+            if acollector is not None:
+                return await acollector(*args)
+            return await _to_thread(collector, *args, deadline=deadline)
+
+    tasks = {
+        i: asyncio.ensure_future(run_blocking(i, collector, args))
+        for i, (_, collector, args, blocking) in enumerate(collectors)
+        if blocking or collector not in _LOOP_SAFE_COLLECTORS
+    }
+    results = []
+    try:
+        for i, (_, collector, args, blocking) in enumerate(collectors):
+            if i not in tasks:
+                if records is not None:
+                    collector = profiling.timed(records[i], collector)
+                results.append(collector(*args))
+                continue
+            if not blocking:
+                # Like in `watermark()`, the timeout only applies to the
+                # blocking collectors
+                results.append(await tasks[i])
+                continue
+            try:
+                results.append(await asyncio.wait_for(
+                    asyncio.shield(tasks[i]), _remaining(deadline)))
+            except asyncio.TimeoutError:
+                tasks[i].cancel()
+                results.append(_TIMED_OUT)
+    finally:
+        for task in tasks.values():
+            task.cancel()
+    return results
+
+
+def _to_thread(func, *args, deadline=None):
+    """Run `func` in a worker thread and return an awaitable future.
+
+    With a deadline, a daemon thread is used for the same reason as in
+    `_run_collectors_until()`; `asyncio.run()` would otherwise wait for
+    the stuck executor thread on shutdown.
+    """
+    import asyncio
+    import contextvars
+
+    loop = asyncio.get_running_loop()
+    context = contextvars.copy_context()
+    if deadline is None:
+        return loop.run_in_executor(None, context.run, func, *args)
+    future = loop.create_future()
+
+    def settle(ok, value):
+        if not future.done():
+            if ok:
+                future.set_result(value)
+            else:
+                future.set_exception(value)
+
+    def run():
+        try:
+            result = (True, context.run(func, *args))
+        except BaseException as e:
+            result = (False, e)
+        try:
+            loop.call_soon_threadsafe(settle, *result)
+        except RuntimeError:  # the event loop is already closed
+            pass
+
+    threading.Thread(target=run, name="watermark-collector",
+                     daemon=True).start()
+    return future
+
+
+def _remaining(deadline, default=None):
+    """Seconds left until `deadline`, capped at `default`."""
+    if deadline is None:
+        return default
+    remaining = max(0.0, deadline - time.monotonic())
+    return remaining if default is None else min(default, remaining)
 
-    return _generate_formatted_text(output)
+
+# Coroutine versions of blocking collectors, used by awatermark()
+_ASYNC_COLLECTORS = {}
 
 
 def _generate_formatted_text(list_of_dicts):
@@ -256,134 +767,457 @@ def _get_datetime(pattern="%Y-%m-%dT%H:%M:%S"):
     return iso_dt
 
 
-def _get_packages(pkgs, check_latest=False):
-    packages = pkgs.split(",")
-    return {package: _get_package_version(package, check_latest)
-            for package in packages}
+def _get_packages(pkgs, check_latest=False, index_url=None,
+                  import_fallback=False, deadline=None, conda_builds=False,
+                  verify=False):
+    versions, installed = _get_installed_packages(pkgs, check_latest,
+                                                  import_fallback)
+    if check_latest:
+        from . import pypi
+
+        latest = pypi.get_latest_versions(list(set(installed.values())),
+                                          index_url=index_url,
+                                          timeout=_remaining(deadline, 2))
+        _add_latest(versions, installed, latest)
+    if conda_builds:
+        _add_conda_builds(versions)
+    if verify:
+        _add_verification(versions)
+    return versions
+
+
+async def _aget_packages(pkgs, check_latest=False, index_url=None,
+                         import_fallback=False, deadline=None,
+                         conda_builds=False, verify=False):
+    from . import pypi
+
+    # Building the distribution index scans the file system
+    versions, installed = await _to_thread(
+        _get_installed_packages, pkgs, check_latest, import_fallback,
+        deadline=deadline)
+    if check_latest:
+        latest = await pypi.aget_latest_versions(
+            list(set(installed.values())), index_url=index_url,
+            timeout=_remaining(deadline, 2))
+        _add_latest(versions, installed, latest)
+    if conda_builds:
+        # Reads conda-meta when it changed
+        await _to_thread(_add_conda_builds, versions, deadline=deadline)
+    if verify:
+        # Hashing reads all files of the packages
+        await _to_thread(_add_verification, versions, deadline=deadline)
+    return versions
+
+
+_ASYNC_COLLECTORS[_get_packages] = _aget_packages
+
+
+def _get_installed_packages(pkgs, check_latest, import_fallback):
+    """Return the installed versions of `pkgs` and, for `check_latest`,
+    the distribution names to query for the installed ones."""
+    index = distributions.get_index()
+    packages = _expand_packages(pkgs.split(","), index)
+    versions = {
+        package: 'unknown' if distributions.is_pattern(package)
+        else _get_package_version(package, index=index,
+                                  import_fallback=import_fallback)
+        for package in packages
+    }
+    installed = {}
+    if check_latest:
+        # Query the index with the distribution name, e.g. `scikit-learn`
+        # rather than the module name `sklearn`
+        for package, version in versions.items():
+            if version != 'unknown':
+                found = index.lookup(package)
+                installed[package] = found[0] if found else package
+    return versions, installed
+
+
+def _expand_packages(packages, index):
+    """Replace glob and `re:` patterns in `packages` by the sorted names
+    of the installed distributions they match, dropping duplicates.
+
+    Patterns without any match are kept and reported as unknown.
+    """
+    patterns = [p for p in packages if distributions.is_pattern(p)]
+    if not patterns:
+        return packages
+    names = [entry[0] for entry in index.by_name.values()]
+    conda_index = conda.get_index()
+    if conda_index is not None:
+        names += [package["name"]
+                  for package in conda_index.packages.values()]
+    matches = distributions.match_names(patterns, names)
+    expanded, seen = [], set()
+    for package in packages:
+        for name in matches.get(package) or [package]:
+            normalized = distributions.normalize_name(name)
+            if normalized not in seen:
+                seen.add(normalized)
+                expanded.append(name)
+    return expanded
+
+
+def _add_latest(versions, installed, latest):
+    for package, dist_name in installed.items():
+        versions[package] = _with_latest(versions[package],
+                                         latest[dist_name])
+
+
+def _add_conda_builds(versions):
+    """Append the build and channel of packages installed by conda."""
+    conda_index = conda.get_index()
+    if conda_index is None:
+        return
+    index = distributions.get_index()
+    for package, version in versions.items():
+        found = conda_index.lookup(package, index)
+        if found is not None and version not in ("unknown",
+                                                  "not installed"):
+            versions[package] = \
+                f"{version} ({found['build']}, {found['channel']})"
+
+
+def _add_verification(versions):
+    """Append the `RECORD` verification status of installed packages."""
+    from . import integrity
+
+    statuses = integrity.verify(
+        [package for package, version in versions.items()
+         if version not in ("unknown", "not installed")])
+    for package, status in statuses.items():
+        versions[package] = f"{versions[package]} ({status})"
+
+
+def _with_latest(current_version, latest_version):
+    if latest_version and latest_version != current_version:
+        return f"{current_version} (version {latest_version} is available)"
+    return current_version
 
 
-def _get_package_version(pkg_name, check_latest=False):
-    """Internal helper to get the version of a package."""
-    current_version = 'unknown'
-    try:
-        current_version = importlib_metadata.version(pkg_name)
-    except (importlib_metadata.PackageNotFoundError, KeyError):
+def _get_package_version(pkg_name, check_latest=False, index=None,
+                         import_fallback=False):
+    """Internal helper to get the version of a package.
+
+    Modules without distribution metadata are not imported unless
+    `import_fallback` is True; their version is read from the already
+    imported module or parsed from the source instead.
+    """
+    if index is None:
+        index = distributions.get_index()
+    current_version = index.version(pkg_name)
+    if current_version is None:
+        # Packages installed by conda without pip metadata
+        conda_index = conda.get_index()
+        found = conda_index and conda_index.lookup(pkg_name)
+        if found:
+            current_version = found["version"]
+    if current_version is None:
+        current_version = _get_module_version(pkg_name, import_fallback)
+
+    if check_latest and current_version != 'unknown':
+        found = index.lookup(pkg_name)
+        dist_name = found[0] if found else pkg_name
+        return _with_latest(current_version, _get_latest_version(dist_name))
+
+    return current_version
+
+
+def _get_module_version(pkg_name, import_fallback=False):
+    module = sys.modules.get(pkg_name)
+    if module is not None:
+        return str(getattr(module, '__version__', 'unknown'))
+    version = distributions.find_static_version(pkg_name)
+    if version is not None:
+        return version
+    if import_fallback:
         try:
             import importlib
             temp_mod = importlib.import_module(pkg_name)
-            current_version = getattr(temp_mod, '__version__', 'unknown')
+            return str(getattr(temp_mod, '__version__', 'unknown'))
         except Exception:
-            current_version = 'unknown'
+            pass
+    return 'unknown'
 
-    if check_latest and current_version != 'unknown':
-        latest_version = _get_latest_version(pkg_name)
-        if latest_version and latest_version != current_version:
-            return f"{current_version} (version {latest_version} is available)"
 
-    return current_version
+def _get_pyversions():
+    # Copied, as the section is handed out with output_format="dict"
+    return dict(_static_fact("pyversions", _compute_pyversions))
 
 
-def _get_pyversions():
+def _compute_pyversions():
+    # Read from the metadata unless IPython is running, so that the
+    # command line interface does not pay for importing it
+    ipython = sys.modules.get("IPython")
+    if ipython is not None:
+        ipython_version = ipython.__version__
+    else:
+        ipython_version = distributions.get_index().version("ipython")
     return {
         "Python implementation": platform.python_implementation(),
         "Python version": platform.python_version(),
-        "IPython version": IPython.__version__,
+        "IPython version": ipython_version or "not installed",
     }
 
 
 def _get_sysinfo():
+    return dict(_static_fact("sysinfo", _compute_sysinfo))
+
+
+def _compute_sysinfo():
     return {
         "Compiler": platform.python_compiler(),
         "OS": platform.system(),
         "Release": platform.release(),
         "Machine": platform.machine(),
         "Processor": platform.processor(),
-        "CPU cores": cpu_count(),
+        "CPU cores": os.cpu_count(),
         "Architecture": platform.architecture()[0],
     }
 
 
+_static_facts = None
+_static_facts_lock = threading.Lock()
+
+
+def _static_fact(name, compute):
+    """Return a fact that is fixed for this host and interpreter.
+
+    Facts are kept in memory and in a per-interpreter cache file keyed by
+    `cache.facts_key()`, so short-lived processes reuse them instead of
+    recomputing them. Missing facts are computed outside the lock and
+    then written back atomically.
+    """
+    global _static_facts
+    with _static_facts_lock:
+        if _static_facts is None:
+            key = cache.facts_key()
+            stored = cache.load_json(cache.facts_file(key)) or {}
+            facts = stored.get("facts") if stored.get("key") == key else None
+            _static_facts = (key, facts or {})
+        key, facts = _static_facts
+        if name in facts:
+            return facts[name]
+
+    value = compute()
+    with _static_facts_lock:
+        facts[name] = value
+        cache.dump_json(cache.facts_file(key), {"key": key, "facts": facts})
+    return value
+
+
+def _get_fingerprint(deadline=None):
+    """Return a short digest of the interpreter, the installed
+    distributions, the Git commit and the host."""
+    import hashlib
+    import json
+
+    environment = {
+        "python": _get_pyversions(),
+        "executable": sys.executable,
+        "distributions": [
+            digest for _, digest in distributions.path_digests(sys.path)
+            if digest is not None
+        ],
+        "git": gitinfo.read_git_info(timeout=_remaining(deadline))["hash"],
+        "host": [gethostname(), _get_sysinfo()],
+    }
+    canonical = json.dumps(environment, sort_keys=True).encode("utf-8")
+    return {"Fingerprint": hashlib.sha256(canonical).hexdigest()[:16]}
+
+
 def _get_commit_hash(machine):
-    process = subprocess.Popen(
-        ["git", "rev-parse", "HEAD"], shell=False, stdout=subprocess.PIPE
-    )
-    git_head_hash = process.communicate()[0].strip()
-    return {"Git hash": git_head_hash.decode("utf-8")}
+    return {"Git hash": gitinfo.read_git_info()["hash"]}
 
 
 def _get_git_remote_origin(machine):
-    process = subprocess.Popen(
-        ["git", "config", "--get", "remote.origin.url"],
-        shell=False,
-        stdout=subprocess.PIPE,
-    )
-    git_remote_origin = process.communicate()[0].strip()
-    return {"Git repo": git_remote_origin.decode("utf-8")}
+    return {"Git repo": gitinfo.read_git_info()["remote"]}
 
 
 def _get_git_branch(machine):
-    process = subprocess.Popen(
-        ["git", "rev-parse", "--abbrev-ref", "HEAD"],
-        shell=False,
-        stdout=subprocess.PIPE,
-    )
-    git_branch = process.communicate()[0].strip()
-    return {"Git branch": git_branch.decode("utf-8")}
+    return {"Git branch": gitinfo.read_git_info()["branch"]}
 
 
-def _get_all_import_versions(vars):
-    to_print = {}
+def _get_git_sections(githash, gitrepo, gitbranch, gitdirty, deadline=None):
+    """Read the repository once and return the requested Git sections
+    by section name."""
+    info = gitinfo.read_git_info(dirty=gitdirty,
+                                 timeout=_remaining(deadline))
+    return _git_sections(info, githash, gitrepo, gitbranch, gitdirty)
 
-    imported_modules = {
-        val
-        for val in list(vars.values())
-        if isinstance(val, types.ModuleType)
-    }
 
-    imported_modules.update(
-        {
-            inspect.getmodule(val) for val in list(vars.values())
-            if inspect.isclass(val) or inspect.isfunction(val)
-        }
-    )
+async def _aget_git_sections(githash, gitrepo, gitbranch, gitdirty,
+                             deadline=None):
+    info = await gitinfo.aread_git_info(dirty=gitdirty,
+                                        timeout=_remaining(deadline))
+    return _git_sections(info, githash, gitrepo, gitbranch, gitdirty)
+
+
+_ASYNC_COLLECTORS[_get_git_sections] = _aget_git_sections
 
-    imported_pkgs = {module.__name__.split(".")[0] for module in imported_modules}
 
+def _git_sections(info, githash, gitrepo, gitbranch, gitdirty):
+    sections = {}
+    if githash:
+        sections["git_hash"] = {"Git hash": info["hash"]}
+    if gitrepo:
+        sections["git_repo"] = {"Git repo": info["remote"]}
+    if gitbranch:
+        sections["git_branch"] = {"Git branch": info["branch"]}
+    if gitdirty:
+        sections["git_dirty"] = {"Git dirty": info["dirty"]}
+    return sections
+
+
+def _get_all_import_versions(vars, import_fallback=False, tracker=None,
+                             conda_builds=False, verify=False):
+    if tracker is None:
+        tracker = ImportTracker()
+    imported_pkgs = tracker.update(vars)
+
+    to_print = {}
     imported_pkgs.discard("builtins")
+    index = distributions.get_index()
     for pkg_name in sorted(imported_pkgs):
-        pkg_version = _get_package_version(pkg_name)
+        pkg_version = _get_package_version(pkg_name, index=index,
+                                           import_fallback=import_fallback)
         if pkg_version not in ("not installed", "unknown"):
             to_print[pkg_name] = pkg_version
+    if conda_builds:
+        _add_conda_builds(to_print)
+    if verify:
+        _add_verification(to_print)
     return to_print
 
 
+_TRACKED_TYPES = (types.ModuleType, type, types.FunctionType)
+
+
+class ImportTracker:
+    """Incrementally maps namespace entries to top-level package names.
+
+    Modules, classes and functions are resolved once per name. Later
+    calls compare a snapshot of `id()`s against the previous one and
+    only resolve names that were added or rebound since. A weak
+    reference callback marks an entry as dead once its object is freed
+    and the next call drops it, so a reused `id()` is never mistaken
+    for an unchanged entry.
+    """
+
+    def __init__(self):
+        self._ids = {}
+        self._packages = {}
+        self._refs = {}
+        # (name, ref) of freed objects. Weakref callbacks may run on any
+        # allocation (e.g., in the middle of update()), so they only
+        # append here and update() removes the entries.
+        self._dead = []
+
+    def update(self, ns):
+        """Return the set of top-level packages referenced in `ns`."""
+        while self._dead:
+            name, ref = self._dead.pop()
+            if self._refs.get(name) is ref:
+                del self._refs[name]
+                self._ids.pop(name, None)
+                self._packages.pop(name, None)
+        # dict(ns) is a cheap C-level copy; iterating list(ns.items())
+        # instead allocates a tuple per entry and triggers the GC
+        current = {name: id(val) for name, val in dict(ns).items()
+                   if isinstance(val, _TRACKED_TYPES)}
+        if current != self._ids:
+            for name in self._ids.keys() - current.keys():
+                self._packages.pop(name, None)
+                self._refs.pop(name, None)
+            for name, _ in current.items() - self._ids.items():
+                val = ns[name]
+                self._packages[name] = _top_level_package(val)
+                self._refs[name] = weakref.ref(val, self._forget(name))
+            self._ids = current
+        packages = set(self._packages.values())
+        packages.discard(None)
+        return packages
+
+    def _forget(self, name):
+        # Must not reference self, which would keep the tracker alive
+        dead = self._dead
+
+        def callback(ref):
+            dead.append((name, ref))
+        return callback
+
+
+def _top_level_package(val):
+    if isinstance(val, types.ModuleType):
+        name = val.__name__
+    else:
+        name = getattr(val, '__module__', None)
+    if not isinstance(name, str):
+        return None
+    return name.split(".")[0]
+
+
 def _get_conda_env():
     name = os.getenv('CONDA_DEFAULT_ENV', 'n/a')
     return {"conda environment": name}
 
 
+# Collectors that `awatermark()` runs on the event loop; all others run
+# in the executor, since they may read files.
+_LOOP_SAFE_COLLECTORS = {_static, _get_conda_env}
+
+
 def _get_gpu_info():
-    if py3nvml is None:
+    from . import gpu
+
+    session = gpu.get_session()
+    if session is None:
         return {"GPU Info": 'Install the gpu extra '
                 '(pip install "watermark[gpu]") '
                 'to display GPU information for NVIDIA chipsets'}
+    not_found = getattr(session.backend, "NVMLError_LibraryNotFound", ())
     try:
-        gpu_info = [""]
-        py3nvml.nvmlInit()
-        num_gpus = py3nvml.nvmlDeviceGetCount()
-        for i in range(num_gpus):
-            handle = py3nvml.nvmlDeviceGetHandleByIndex(i)
-            gpu_name = py3nvml.nvmlDeviceGetName(handle)
-            gpu_info.append(f"GPU {i}: {gpu_name}")
-        py3nvml.nvmlShutdown()
-        return {"GPU Info": "\n  ".join(gpu_info)}
-
-    except py3nvml.NVMLError_LibraryNotFound:
+        inventory = session.inventory()
+    except not_found:
         return {"GPU Info": "NVIDIA drivers do not appear "
                 "to be installed on this machine."}
-    except:
+    except Exception:
         return {"GPU Info": "GPU information is not "
                 "available for this machine."}
+    section = {"GPU Info": inventory["devices"]}
+    if inventory["driver_version"]:
+        section["NVIDIA driver"] = inventory["driver_version"]
+    if inventory["cuda_version"]:
+        section["CUDA version"] = inventory["cuda_version"]
+    return section
+
+
+def _get_resources():
+    from . import resources
+
+    info = resources.read()
+    if info is None:
+        return {"Resources": "n/a (no /proc file system)"}
+    loadavg = info["loadavg"]
+    return {
+        "RSS": _mib(info["rss"]),
+        "Peak RSS": _mib(info["peak_rss"]),
+        "Threads": info["threads"],
+        "Open files": info["open_fds"],
+        "CPU limit": "none" if info["cpu_limit"] is None
+        else f"{info['cpu_limit']:g} CPUs",
+        "Memory limit": "none" if info["memory_limit"] is None
+        else _mib(info["memory_limit"]),
+        "Load average": "unknown" if loadavg is None
+        else ", ".join(f"{value:.2f}" for value in loadavg),
+        "CPU model": info["cpu_model"] or "unknown",
+        "CPU MHz": info["cpu_mhz"] or "unknown",
+    }
+
+
+def _mib(value):
+    return "unknown" if value is None else f"{value / 2**20:.1f} MiB"
 
 
 def _get_jupyter_env():
@@ -417,7 +1251,9 @@ def _get_jupyter_env():
         if parent_app and any(token in parent_lower for token in ('notebook', 'nbclassic')):
             return False
 
-        return importlib.util.find_spec('jupyterlab') is not None
+        return _static_fact(
+            "jupyterlab",
+            lambda: importlib.util.find_spec('jupyterlab') is not None)
 
     try:
         shell = get_ipython().__class__.__name__
@@ -433,17 +1269,37 @@ def _get_jupyter_env():
     return "Unknown / Classic Jupyter"
 
 
+def _get_jupyter_section():
+    return {"Jupyter enviroment": _get_jupyter_env()}
+
+
+def _get_python_installation_section():
+    return {"Python installation": _get_python_installation()}
+
+
 def _get_python_installation():
     """Internal helper to detect how Python was installed (Issue #89)."""
+    return _static_fact("python_installation", _compute_python_installation)
+
+
+def _compute_python_installation():
     import sys
+
+    virtual = hasattr(sys, 'real_prefix') or (
+        hasattr(sys, 'base_prefix') and sys.base_prefix != sys.prefix)
+    return _classify_python_installation(sys.executable, virtual)
+
+
+def _classify_python_installation(executable, virtual):
+    """Guess how the interpreter at `executable` was installed."""
     import os
 
-    exe_path = sys.executable.lower()
+    exe_path = executable.lower()
 
     if 'conda' in exe_path or 'anaconda' in exe_path or 'miniconda' in exe_path:
         return "Conda"
 
-    if hasattr(sys, 'real_prefix') or (hasattr(sys, 'base_prefix') and sys.base_prefix != sys.prefix):
+    if virtual:
         return "Virtual Environment (venv/virtualenv)"
 
     if '.pyenv' in exe_path:
@@ -461,14 +1317,9 @@ def _get_python_installation():
     return "System/Official"
 
 
-def _get_latest_version(package_name):
+def _get_latest_version(package_name, index_url=None):
     """Fetch the latest version of a package from PyPI."""
-    import urllib.request
-    import json
-    try:
-        url = f"https://pypi.org/pypi/{package_name}/json"
-        with urllib.request.urlopen(url, timeout=2) as response:
-            data = json.loads(response.read().decode())
-            return data['info']['version']
-    except Exception:
-        return None
+    from . import pypi
+
+    return pypi.get_latest_versions([package_name],
+                                    index_url=index_url)[package_name]